@@ -3,21 +3,84 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from config import config
 import os
+import hashlib
 import logging
+import time
 from logging.handlers import RotatingFileHandler
-from sqlalchemy import text, inspect
+from sqlalchemy import event, text, inspect
 from sqlalchemy.exc import SQLAlchemyError
 
-db = SQLAlchemy()
+from app.utils.replica import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump when fix_database_schema gains a repair step, so databases that already
+# match the models still get it on the next boot
+SCHEMA_FIX_VERSION = 1
+
+def schema_fingerprint():
+    """SHA-256 over the models' tables, columns and indexes plus SCHEMA_FIX_VERSION"""
+    parts = [f"fix:{SCHEMA_FIX_VERSION}"]
+    for name, table in sorted(db.metadata.tables.items()):
+        parts.append(f"table:{name}")
+        for column in table.columns:
+            parts.append(f"column:{column.name}:{column.type}:{column.nullable}")
+        for index in sorted(table.indexes, key=lambda index: index.name or ''):
+            parts.append(f"index:{index.name}:{','.join(c.name for c in index.columns)}")
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+def schema_is_current(fingerprint):
+    """True if the database recorded this fingerprint; one primary-key lookup"""
+    try:
+        row = db.session.execute(text("SELECT fingerprint FROM schema_version WHERE id = 1")).first()
+    except SQLAlchemyError:
+        # No schema_version table yet
+        db.session.rollback()
+        return False
+    finally:
+        db.session.close()
+    return row is not None and row[0] == fingerprint
+
+def record_schema_fingerprint(fingerprint):
+    from app.models import SchemaVersion
+    state = db.session.get(SchemaVersion, 1) or SchemaVersion(id=1)
+    state.fingerprint = fingerprint
+    db.session.add(state)
+    db.session.commit()
+
+def ensure_database_schema(app, force=False):
+    """Create and repair the schema, unless the recorded fingerprint says it is already current.
+
+    Returns True if the check ran. Pass force=True (flask amf fix-schema) to
+    run it regardless.
+    """
+    with app.app_context():
+        fingerprint = schema_fingerprint()
+        if not force and schema_is_current(fingerprint):
+            return False
+        logger.info("Initializing database schema...")
+        db.create_all()
+        if fix_database_schema(app):
+            record_schema_fingerprint(fingerprint)
+        else:
+            # Leave the fingerprint alone so the next boot retries the failed steps
+            logger.warning("Schema fingerprint not recorded; the repair will run again on next boot")
+        logger.info("Database initialization complete")
+        return True
+
 def fix_database_schema(app):
-    """Add missing columns to database tables if they don't exist"""
+    """Add missing columns to database tables if they don't exist.
+
+    Returns True only if every step succeeded; a failed step is logged and
+    the rest still run, but the caller must not treat the schema as current.
+    """
     logger.info("Checking database schema for missing columns...")
+    failures = 0
     try:
         with app.app_context():
             # Get database inspector
@@ -28,7 +91,7 @@ def fix_database_schema(app):
                 logger.warning("'atv' table not found! Creating all tables...")
                 db.create_all()
                 logger.info("Tables created successfully")
-                return
+                return True
             
             # Each operation in a separate transaction for better reliability
             # 1. Add missing columns to ATV table
@@ -53,6 +116,7 @@ def fix_database_schema(app):
                             logger.info(f"Added '{column}' successfully")
                         except Exception as e:
                             logger.error(f"Error adding column '{column}': {str(e)}")
+                            failures += 1
             
             # 2. Update NULL statuses in a separate transaction
             with db.engine.begin() as connection:
@@ -61,6 +125,7 @@ def fix_database_schema(app):
                     logger.info(f"Updated {result.rowcount} ATVs with NULL status to 'active'")
                 except Exception as e:
                     logger.error(f"Error updating NULL statuses: {str(e)}")
+                    failures += 1
                     
             # 3. Check part table in a separate transaction
             if 'part' in inspector.get_table_names():
@@ -73,12 +138,95 @@ def fix_database_schema(app):
                             logger.info("Added 'condition' column to part table successfully")
                         except Exception as e:
                             logger.error(f"Error adding 'condition' to part table: {str(e)}")
+                            failures += 1
+            
+            # 4. Add columns introduced since the original schema
+            added_columns = {
+                'part': {'updated_at': "TIMESTAMP"},
+                'expense': {'updated_at': "TIMESTAMP"},
+                'sale': {'updated_at': "TIMESTAMP"},
+                'image': {
+                    'updated_at': "TIMESTAMP",
+                    'processing_status': "VARCHAR(20)",
+                    'content_hash': "VARCHAR(64)"
+                }
+            }
+            for table, table_required in added_columns.items():
+                if table not in inspector.get_table_names():
+                    continue
+                with db.engine.begin() as connection:
+                    table_columns = [column['name'] for column in inspector.get_columns(table)]
+                    for column, definition in table_required.items():
+                        if column in table_columns:
+                            continue
+                        logger.info(f"Adding '{column}' column to {table} table")
+                        try:
+                            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+                            logger.info(f"Added '{column}' column to {table} table successfully")
+                        except Exception as e:
+                            logger.error(f"Error adding '{column}' to {table} table: {str(e)}")
+                            failures += 1
+            
+            # 5. Backfill ATV financial rollups (e.g. first boot after the table was added)
+            try:
+                from app.models import ATV, ATVRollup, rebuild_atv_rollups
+                if db.session.query(ATVRollup).count() < db.session.query(ATV).count():
+                    logger.info("Backfilling ATV financial rollups")
+                    rebuilt = rebuild_atv_rollups()
+                    logger.info(f"Rebuilt rollups for {rebuilt} ATVs")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error backfilling ATV rollups: {str(e)}")
+                failures += 1
             
+            if failures:
+                logger.error(f"Database schema check finished with {failures} failed steps")
+                return False
             logger.info("Database schema check and fix completed successfully")
+            return True
     except Exception as e:
         logger.error(f"Unexpected error during schema fix: {str(e)}")
+        return False
+
+def configure_sqlite(app):
+    """Apply app.config['SQLITE_PRAGMAS'] to each new connection of every SQLite engine"""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _set_sqlite_pragmas)
+
+class _StartupTimer:
+    """Collects how long each create_app phase took, for one log line at the end"""
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def summary(self):
+        total = (self.last - self.started) * 1000
+        breakdown = ', '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases)
+        return f"Startup took {total:.0f}ms ({breakdown})"
 
 def create_app(config_name=None):
+    timer = _StartupTimer()
     app = Flask(__name__, instance_relative_config=True)
     
     # Determine configuration to use
@@ -89,7 +237,9 @@ def create_app(config_name=None):
     config[config_name].init_app(app)
 
     db.init_app(app)
+    configure_sqlite(app)
     migrate.init_app(app, db)
+    timer.mark('config')
 
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
@@ -107,6 +257,22 @@ def create_app(config_name=None):
     from app.reports import bp as reports_bp
     app.register_blueprint(reports_bp)
 
+    from app.cli import amf_cli
+    app.cli.add_command(amf_cli)
+    timer.mark('blueprints')
+
+    # Query count and DB time per request: Server-Timing, slow request log, /admin/perf
+    from app.utils.perf import init_perf
+    init_perf(app)
+
+    # Compress large HTML/JSON/CSV responses
+    from app.utils.compression import init_compression
+    init_compression(app)
+
+    # Serve the hashed static asset build, if there is one
+    from app.utils.assets import init_static
+    init_static(app)
+
     # Create upload folder if it doesn't exist
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -114,9 +280,10 @@ def create_app(config_name=None):
     # Create specific folders for uploads
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'atv'), exist_ok=True)
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'part'), exist_ok=True)
+    timer.mark('static/uploads')
 
     # Set up error logging
-    if not app.debug:
+    if not app.debug and not app.testing:
         if not os.path.exists('logs'):
             os.mkdir('logs')
         file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240, backupCount=10)
@@ -135,14 +302,16 @@ def create_app(config_name=None):
         app.logger.setLevel(logging.DEBUG)
         app.logger.debug('Debug mode enabled')
 
+    timer.mark('logging')
+
     # Import models before creating tables
     from app import models
 
-    with app.app_context():
-        logger.info("Initializing database schema...")
-        db.create_all()
-        fix_database_schema(app)
-        logger.info("Database initialization complete")
+    # Introspection and repair only run when the models changed since the last check
+    if ensure_database_schema(app):
+        timer.mark('schema repair')
+    else:
+        timer.mark('schema check')
     
     # Add a global template context processor for date/time
     @app.context_processor
@@ -150,4 +319,5 @@ def create_app(config_name=None):
         from datetime import datetime
         return {'now': datetime.utcnow()}
 
+    logger.info(timer.summary())
     return app
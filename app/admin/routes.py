@@ -1,7 +1,9 @@
 """Admin routes for data management"""
-from flask import render_template, redirect, url_for, flash, send_file, request
+from flask import render_template, redirect, url_for, flash, send_file, request, current_app
 from app.admin import bp
-from app.utils.data_management import export_data, import_data
+from app.utils.data_management import (export_data, import_data, is_backup_file, read_backup_manifest,
+                                       is_snapshot_file, create_snapshot, restore_snapshot, sqlite_database_path)
+from app.utils.perf import endpoint_summary
 import os
 from datetime import datetime
 from werkzeug.utils import secure_filename
@@ -14,28 +16,54 @@ def index():
     backups = []
     if os.path.exists(backup_dir):
         for file in os.listdir(backup_dir):
-            if file.endswith('.json'):
+            if is_backup_file(file):
                 path = os.path.join(backup_dir, file)
+                if is_snapshot_file(file):
+                    manifest = {'kind': 'snapshot'}
+                else:
+                    try:
+                        manifest = read_backup_manifest(path) or {}
+                    except (OSError, ValueError):
+                        manifest = {}
                 backups.append({
                     'filename': file,
+                    'kind': manifest.get('kind', 'full'),
                     'size': os.path.getsize(path) / 1024,  # Size in KB
                     'modified': datetime.fromtimestamp(os.path.getmtime(path))
                 })
     backups.sort(key=lambda x: x['modified'], reverse=True)
     
-    return render_template('admin/index.html', backups=backups)
+    return render_template('admin/index.html', backups=backups,
+                         snapshots_enabled=sqlite_database_path() is not None)
+
+@bp.route('/admin/perf')
+def perf():
+    """Per-endpoint request and database timings for this worker process"""
+    return render_template('admin/perf.html', endpoints=endpoint_summary(),
+                           slow_request_ms=current_app.config['PERF_SLOW_REQUEST_MS'])
 
 @bp.route('/admin/backup')
 def create_backup():
-    """Create a new backup"""
+    """Create a new backup (?incremental=1 for a delta against the latest backup)"""
     try:
-        backup_path = export_data()
+        backup_path = export_data(incremental=request.args.get('incremental', type=int) == 1)
         flash(f'Backup created successfully: {os.path.basename(backup_path)}', 'success')
     except Exception as e:
         flash(f'Error creating backup: {str(e)}', 'error')
     
     return redirect(url_for('admin.index'))
 
+@bp.route('/admin/snapshot')
+def create_snapshot_backup():
+    """Create a SQLite snapshot of the database"""
+    try:
+        snapshot_path = create_snapshot()
+        flash(f'Snapshot created successfully: {os.path.basename(snapshot_path)}', 'success')
+    except Exception as e:
+        flash(f'Error creating snapshot: {str(e)}', 'error')
+    
+    return redirect(url_for('admin.index'))
+
 @bp.route('/admin/restore/<filename>')
 def restore_backup(filename):
     """Restore from a backup file"""
@@ -47,7 +75,10 @@ def restore_backup(filename):
             flash('Backup file not found', 'error')
             return redirect(url_for('admin.index'))
         
-        import_data(backup_path, clear_existing=True)
+        if is_snapshot_file(backup_path):
+            restore_snapshot(backup_path)
+        else:
+            import_data(backup_path, clear_existing=True)
         flash('Data restored successfully!', 'success')
     except Exception as e:
         flash(f'Error restoring backup: {str(e)}', 'error')
@@ -92,8 +123,8 @@ def upload_backup():
         flash('No file selected', 'error')
         return redirect(url_for('admin.index'))
     
-    if not file.filename.endswith('.json'):
-        flash('Invalid file type. Please upload a .json backup file', 'error')
+    if not is_backup_file(file.filename):
+        flash('Invalid file type. Please upload a .json.gz, .json or .sqlite3 backup file', 'error')
         return redirect(url_for('admin.index'))
     
     try:
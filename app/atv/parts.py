@@ -1,13 +1,56 @@
 from flask import render_template, redirect, url_for, request, current_app, flash, jsonify
 from werkzeug.utils import secure_filename
-import os
 from app.atv import bp
-from app.models import ATV, Part, Image, Storage
+from app.models import ATV, Part, Image, Storage, part_status_summary, load_primary_images
 from app import db
 from app.atv.forms import PartForm
+from app.utils.pagination import keyset_paginate
+from app.utils.images import remove_image_files
+from app.utils.image_worker import add_uploaded_image
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager, joinedload
 from datetime import datetime
 # eBay-related imports removed
 
+def part_list_options(atv_joined=False):
+    """Loader options for part list views.
+
+    Pulls each part's ATV and storage location into the list query itself.
+    Pass atv_joined=True when the query already joins ATV explicitly so that
+    join is reused instead of adding a second one. Images are a dynamic
+    relationship and are batch-loaded separately with load_primary_images().
+    """
+    atv_loader = contains_eager(Part.atv) if atv_joined else joinedload(Part.atv)
+    return [atv_loader, joinedload(Part.storage)]
+
+def part_sort_order(sort_by):
+    """Keyset ordering for each parts list sort option, ending with the primary key"""
+    created = func.coalesce(Part.created_at, datetime(1970, 1, 1))
+    price = func.coalesce(Part.list_price, -1)
+    orders = {
+        'newest': [(created, True)],
+        'price_asc': [(price, False)],
+        'price_desc': [(price, True)],
+        'name': [(Part.name, False)],
+        'atv': [(ATV.year, True), (ATV.make, False), (ATV.model, False), (Part.name, False)],
+    }
+    return orders.get(sort_by, []) + [(Part.id, True)]
+
+def apply_part_filters(query, args):
+    """Apply the parts list filter parameters (atv, storage, status, condition,
+    platform, tote) from a request's args to a Part query"""
+    atv_id = args.get('atv_id', type=int)
+    storage_id = args.get('storage_id', type=int)
+    if atv_id:
+        query = query.filter(Part.atv_id == atv_id)
+    if storage_id:
+        query = query.filter(Part.storage_id == storage_id)
+    for field in ('status', 'condition', 'platform', 'tote'):
+        value = args.get(field)
+        if value:
+            query = query.filter(getattr(Part, field) == value)
+    return query
+
 @bp.route('/parts')
 def parts_list():
     """Show all parts with advanced filtering and sorting options"""
@@ -22,46 +65,24 @@ def parts_list():
     view_mode = request.args.get('view_mode', 'grid')
 
     # Start with base query
-    query = Part.query.join(ATV)
+    query = Part.query.join(ATV).options(*part_list_options(atv_joined=True))
 
     # Apply filters
-    if atv_id:
-        query = query.filter(Part.atv_id == atv_id)
-    else:
+    query = apply_part_filters(query, request.args)
+    if not atv_id:
         # Only show parts from ATVs that are being parted out or have been parted out
         query = query.filter(ATV.parting_status.in_(['parting_out', 'parted_out']))
 
-    if storage_id:
-        query = query.filter(Part.storage_id == storage_id)
-    if status:
-        query = query.filter(Part.status == status)
-    if condition:
-        query = query.filter(Part.condition == condition)
-    if platform:
-        query = query.filter(Part.platform == platform)
-    if tote:
-        query = query.filter(Part.tote == tote)
-
-    # Apply sorting (default to name if other options fail)
-    try:
-        if sort_by == 'newest' and hasattr(Part, 'created_at'):
-            query = query.order_by(Part.created_at.desc())
-        elif sort_by == 'price_asc':
-            query = query.order_by(Part.list_price.asc())
-        elif sort_by == 'price_desc':
-            query = query.order_by(Part.list_price.desc())
-        elif sort_by == 'name' or sort_by == 'newest': # Use name as fallback for newest
-            query = query.order_by(Part.name.asc())
-        elif sort_by == 'atv':
-            query = query.order_by(ATV.year.desc(), ATV.make.asc(), ATV.model.asc(), Part.name.asc())
-        else:
-            query = query.order_by(Part.id.desc()) # Fallback to ID sorting
-    except Exception as e:
-        current_app.logger.error(f"Sorting error: {e}")
-        query = query.order_by(Part.id.desc()) # Ultimate fallback
-
-    # Execute query
-    parts = query.all()
+    # Paginate with a keyset cursor on the requested sort order
+    page = keyset_paginate(
+        query,
+        part_sort_order(sort_by),
+        sort_by,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', type=int)
+    )
+    parts = load_primary_images(page.items)
 
     # Get list of ATVs being parted out
     parting_atvs = ATV.query.filter(ATV.parting_status.in_(['parting_out', 'parted_out'])).order_by(
@@ -76,25 +97,19 @@ def parts_list():
     totes = [t[0] for t in distinct_totes if t[0]] # Filter out None/empty values
     totes.sort()
 
-    # Calculate total value
-    total_value = sum(
-        part.list_price if part.status != 'sold' else part.sold_price
-        for part in parts
-        if (part.status != 'sold' and part.list_price) or (part.status == 'sold' and part.sold_price)
-    )
-    
-    # Get status counts for summary
-    status_counts = {
-        'all': len(parts),
-        'in_stock': sum(1 for part in parts if part.status == 'in_stock'),
-        'listed': sum(1 for part in parts if part.status == 'listed'),
-        'reserved': sum(1 for part in parts if part.status == 'reserved'),
-        'sold': sum(1 for part in parts if part.status == 'sold')
-    }
+    # Status counts and total value come from the whole filtered set, not just this page
+    status_counts, total_value = part_status_summary(query)
+
+    # Filters to carry over on sort and next/prev links
+    filter_args = {k: v for k, v in request.args.items() if k not in ('after', 'before', 'sort_by')}
+    page_args = dict(filter_args, sort_by=sort_by)
 
     template_vars = {
         'title': 'Parts List',
         'parts': parts,
+        'page': page,
+        'filter_args': filter_args,
+        'page_args': page_args,
         'parting_atvs': parting_atvs,
         'storages': storages,
         'totes': totes,
@@ -133,10 +148,17 @@ def parts_list():
 def atv_parts(atv_id):
     """Show parts for a specific ATV"""
     atv = ATV.query.get_or_404(atv_id)
+    parts = load_primary_images(
+        Part.query.filter(Part.atv_id == atv.id)
+        .options(*part_list_options())
+        .order_by(Part.name.asc(), Part.id.asc())
+        .all()
+    )
     
     template_vars = {
         'title': f'Parts - {atv.year} {atv.make} {atv.model}',
-        'atv': atv
+        'atv': atv,
+        'parts': parts
     }
     
     # Try several template paths in order
@@ -165,15 +187,9 @@ def handle_image_upload(files, part):
     for file in files:
         if file and file.filename:
             filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{timestamp}_{filename}"
-            file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-            
-            image = Image(
-                filename=filename,
-                part=part
-            )
-            db.session.add(image)
+            extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+            # Resized copies are made in the background once the caller commits
+            add_uploaded_image(file, extension, part=part)
 
 @bp.route('/<int:atv_id>/parts/add', methods=['GET', 'POST'])
 def add_part(atv_id):
@@ -367,11 +383,8 @@ def edit_part(part_id):
             for image_id in image_ids:
                 image = Image.query.get(image_id)
                 if image and image.part_id == part.id:
-                    # Delete the file
-                    try:
-                        os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], image.filename))
-                    except:
-                        pass  # File might not exist
+                    # Delete the file and its variants
+                    remove_image_files(image)
                     db.session.delete(image)
 
         db.session.commit()
@@ -482,10 +495,7 @@ def delete_part(id):
     
     # Delete associated images first
     for image in part.images:
-        try:
-            os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], image.filename))
-        except:
-            pass  # File might not exist
+        remove_image_files(image)
         db.session.delete(image)
     
     # Delete the part
@@ -506,11 +516,8 @@ def delete_part_image(id, image_id):
         flash('Invalid image!', 'error')
         return redirect(url_for('atv.view_part', id=id))
     
-    # Delete the file
-    try:
-        os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], image.filename))
-    except:
-        pass  # File might not exist
+    # Delete the file and its variants
+    remove_image_files(image)
     
     # Delete the database record
     db.session.delete(image)
@@ -1,15 +1,56 @@
-from flask import render_template, redirect, url_for, request, send_file, current_app, flash
+from flask import render_template, redirect, url_for, request, abort, flash, Response, stream_with_context
 from app.atv import bp
 from app.models import ATV, Part, Expense, Sale, Image
 from app import db
 from app.atv.forms import ATVForm, PartForm, ExpenseForm, SaleForm, ImageUploadForm
+from app.utils.pagination import keyset_paginate
+from app.atv.parts import apply_part_filters
+from app.utils.images import (image_file_path, remove_image_files, image_url, is_stored, media_file_path,
+                              send_image, stored_original_name)
+from app.utils.image_worker import add_uploaded_image
+from app.utils.replica import analytics_reads, uses_analytics_db
 from datetime import datetime, timedelta, date, time
 import os
 from werkzeug.utils import secure_filename
 import csv
-from io import StringIO, BytesIO
 from sqlalchemy import func
-import uuid
+from sqlalchemy.orm import contains_eager
+
+bp.add_app_template_global(image_url)
+
+def load_page_financials(atvs):
+    """Financial totals for the ATVs on the current page, read from their rollup rows.
+
+    Load the ATVs with their rollup eagerly (joined or selectinload) so this issues no queries.
+    Returns {atv_id: totals} for the template to read from.
+    """
+    return {
+        atv.id: {
+            'expenses_total': atv.total_expenses(),
+            'sales_total': atv.total_sales(),
+            'parts_value': atv.total_parts_value(),
+            'parts_profit': atv.parts_profit(),
+            'sold_part_count': atv.sold_parts_count(),
+            'part_count': atv.parts_count(),
+            'profit_loss': atv.profit_loss(),
+        }
+        for atv in atvs
+    }
+
+def atv_sort_order(sort_by):
+    """Keyset ordering for each ATV list sort option, ending with the primary key"""
+    created = func.coalesce(ATV.created_at, datetime(1970, 1, 1))
+    orders = {
+        'newest': [(created, True)],
+        'oldest': [(created, False)],
+        'make_asc': [(ATV.make, False), (ATV.model, False)],
+        'make_desc': [(ATV.make, True), (ATV.model, True)],
+        'year_asc': [(ATV.year, False)],
+        'year_desc': [(ATV.year, True)],
+        'profit': [(ATV.profit_loss(), True)],
+        'profit_rate': [(ATV.hourly_profit_rate(), True)],
+    }
+    return orders.get(sort_by, []) + [(ATV.id, True)]
 
 @bp.route('/')
 def index():
@@ -19,8 +60,9 @@ def index():
     sort_by = request.args.get('sort_by', 'newest')
     view_mode = request.args.get('view_mode', 'compact')
     
-    # Base query
-    query = ATV.query.filter(ATV.status != 'deleted')
+    # Base query; the rollup join feeds both the financial columns and the profit sorts
+    query = (ATV.query.outerjoin(ATV.rollup).options(contains_eager(ATV.rollup))
+             .filter(ATV.status != 'deleted'))
     
     # Apply filters
     if parting_status:
@@ -28,38 +70,37 @@ def index():
     if status:
         query = query.filter(ATV.status == status)
     
-    # Apply sorting
-    if sort_by == 'newest':
-        query = query.order_by(ATV.created_at.desc())
-    elif sort_by == 'oldest':
-        query = query.order_by(ATV.created_at.asc())
-    elif sort_by == 'make_asc':
-        query = query.order_by(ATV.make.asc(), ATV.model.asc())
-    elif sort_by == 'make_desc':
-        query = query.order_by(ATV.make.desc(), ATV.model.desc())
-    elif sort_by == 'year_asc':
-        query = query.order_by(ATV.year.asc())
-    elif sort_by == 'year_desc':
-        query = query.order_by(ATV.year.desc())
-    elif sort_by == 'profit':
-        # We can't sort directly by the profit property since it's calculated
-        # We'll sort by total_earnings as a proxy
-        query = query.order_by(ATV.total_earnings.desc())
-    
-    # Execute query
-    atvs = query.all()
+    # Paginate with a keyset cursor on the requested sort order
+    page = keyset_paginate(
+        query,
+        atv_sort_order(sort_by),
+        sort_by,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', 30, type=int)
+    )
+    atvs = page.items
+    financials = load_page_financials(atvs)
     
     # Calculate parting status counts for filters
-    status_counts = {
-        'whole': ATV.query.filter(ATV.parting_status == 'whole').count(),
-        'parting_out': ATV.query.filter(ATV.parting_status == 'parting_out').count(),
-        'parted_out': ATV.query.filter(ATV.parting_status == 'parted_out').count(),
-    }
+    status_counts = {'whole': 0, 'parting_out': 0, 'parted_out': 0}
+    status_counts.update(
+        db.session.query(ATV.parting_status, func.count(ATV.id))
+        .filter(ATV.parting_status.in_(list(status_counts)))
+        .group_by(ATV.parting_status)
+        .all()
+    )
+    
+    # Filters to carry over on the next/prev links
+    page_args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
     
     return render_template(
         'atv/index.html', 
         title='ATVs', 
         atvs=atvs,
+        page=page,
+        page_args=page_args,
+        financials=financials,
         parting_status=parting_status,
         status=status,
         sort_by=sort_by,
@@ -240,18 +281,20 @@ def delete_sale(id):
     return redirect(url_for('atv.view_atv', id=atv_id))
 
 # Reports route
-@bp.route('/reports')
-def reports():
-    """Shows financial reports and transaction logs"""
-    # Get filter options from query parameters
-    filter_type = request.args.get('filter_type', 'custom')
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-    filter_month = request.args.get('month')
-    filter_year = request.args.get('year')
-    
+def report_date_range(args):
+    """Resolve the reports date filter (month, year, current month, custom range
+    or the last 30 days by default) from request args.
+
+    Returns (filter_type, start_date, end_date).
+    """
+    filter_type = args.get('filter_type', 'custom')
+    start_date_str = args.get('start_date')
+    end_date_str = args.get('end_date')
+    filter_month = args.get('month')
+    filter_year = args.get('year')
+
     today = datetime.now().date()
-    
+
     # Handle different filter types
     if filter_type == 'month' and filter_month and filter_year:
         # Month filter - show entire month
@@ -282,6 +325,19 @@ def reports():
         # Default to last 30 days
         end_date = today
         start_date = end_date - timedelta(days=30)
+
+    return filter_type, start_date, end_date
+
+@bp.route('/reports')
+@uses_analytics_db
+def reports():
+    """Shows financial reports and transaction logs"""
+    # Get filter options from query parameters
+    filter_type, start_date, end_date = report_date_range(request.args)
+    filter_month = request.args.get('month')
+    filter_year = request.args.get('year')
+    
+    today = datetime.now().date()
     
     # Create lists for month and year dropdowns
     current_year = today.year
@@ -460,107 +516,154 @@ def reports():
                          part_sales=part_sales,
                          atv_sales=atv_sales)
 
+# Rows fetched per round trip when streaming exports
+EXPORT_BATCH_SIZE = 500
+
+# Request args that select the reports date range for an export
+DATE_RANGE_ARGS = ('filter_type', 'start_date', 'end_date', 'month', 'year')
+
+class _EchoWriter:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+def stream_csv(header, rows, batch_size=EXPORT_BATCH_SIZE):
+    """Yield CSV text for a header and an iterable of rows, a batch at a time"""
+    writer = csv.writer(_EchoWriter())
+    chunk = [writer.writerow(header)]
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= batch_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+def _format_date(value):
+    return value.strftime('%Y-%m-%d') if value else ''
+
+def _atv_label(row):
+    return f"{row.atv_year} {row.atv_make} {row.atv_model}"
+
+def export_rows(data_type, args):
+    """Return (header, row generator) for a CSV export.
+
+    Each export is a plain column query, with the ATV label joined in rather
+    than loaded per row, and is read in EXPORT_BATCH_SIZE batches (a
+    server-side cursor on PostgreSQL) so memory stays flat however large the
+    table is. Parts accept the parts list filters; every export accepts
+    atv_id and, when given, the reports date range.
+    """
+    date_range = None
+    if any(args.get(name) for name in DATE_RANGE_ARGS):
+        _, start_date, end_date = report_date_range(args)
+        date_range = (start_date, end_date)
+    atv_id = args.get('atv_id', type=int)
+    atv_columns = (ATV.year.label('atv_year'), ATV.make.label('atv_make'), ATV.model.label('atv_model'))
+
+    if data_type == 'atvs':
+        header = ['ID', 'Make', 'Model', 'Year', 'VIN', 'Status', 'Purchase Date',
+                  'Purchase Price', 'Purchase Location', 'Description', 'Total Earnings']
+        query = db.session.query(
+            ATV.id, ATV.make, ATV.model, ATV.year, ATV.vin, ATV.status, ATV.purchase_date,
+            ATV.purchase_price, ATV.purchase_location, ATV.description, ATV.total_earnings
+        ).filter(ATV.status != 'deleted').order_by(ATV.id)
+        if atv_id:
+            query = query.filter(ATV.id == atv_id)
+        if date_range:
+            query = query.filter(ATV.purchase_date.between(*date_range))
+
+        def rows(result):
+            for row in result:
+                yield [row.id, row.make, row.model, row.year, row.vin, row.status,
+                       _format_date(row.purchase_date), row.purchase_price,
+                       row.purchase_location, row.description, row.total_earnings]
+    elif data_type == 'parts':
+        header = ['ID', 'ATV', 'Name', 'Part Number', 'Condition', 'Location',
+                  'Status', 'Source Price', 'List Price', 'Sold Price',
+                  'Sold Date', 'Platform', 'Listing URL', 'Description']
+        query = db.session.query(
+            Part.id, *atv_columns, Part.name, Part.part_number, Part.condition, Part.location,
+            Part.status, Part.source_price, Part.list_price, Part.sold_price,
+            Part.sold_date, Part.platform, Part.listing_url, Part.description
+        ).join(ATV).filter(ATV.status != 'deleted').order_by(Part.id)
+        query = apply_part_filters(query, args)
+        if date_range:
+            query = query.filter(Part.sold_date.between(*date_range))
+
+        def rows(result):
+            for row in result:
+                yield [row.id, _atv_label(row), row.name, row.part_number, row.condition,
+                       row.location, row.status, row.source_price, row.list_price,
+                       row.sold_price, _format_date(row.sold_date), row.platform,
+                       row.listing_url, row.description]
+    elif data_type == 'expenses':
+        header = ['ID', 'ATV', 'Date', 'Category', 'Amount', 'Description']
+        query = db.session.query(
+            Expense.id, *atv_columns, Expense.date, Expense.category,
+            Expense.amount, Expense.description
+        ).join(ATV).filter(ATV.status != 'deleted').order_by(Expense.id)
+        if atv_id:
+            query = query.filter(Expense.atv_id == atv_id)
+        if date_range:
+            query = query.filter(Expense.date.between(*date_range))
+
+        def rows(result):
+            for row in result:
+                yield [row.id, _atv_label(row), _format_date(row.date), row.category,
+                       row.amount, row.description]
+    else:
+        header = ['ID', 'ATV', 'Date', 'Type', 'Platform', 'Amount',
+                  'Fees', 'Shipping', 'Net Amount', 'Description']
+        query = db.session.query(
+            Sale.id, *atv_columns, Sale.date, Sale.type, Sale.platform, Sale.amount,
+            Sale.fees, Sale.shipping_cost, Sale.net_amount, Sale.description
+        ).join(ATV).filter(ATV.status != 'deleted').order_by(Sale.id)
+        if atv_id:
+            query = query.filter(Sale.atv_id == atv_id)
+        if date_range:
+            query = query.filter(Sale.date.between(*date_range))
+
+        def rows(result):
+            for row in result:
+                yield [row.id, _atv_label(row), _format_date(row.date), row.type,
+                       row.platform, row.amount, row.fees, row.shipping_cost,
+                       row.net_amount, row.description]
+
+    return header, rows(query.yield_per(EXPORT_BATCH_SIZE))
+
 @bp.route('/export/<data_type>')
 def export_data(data_type):
-    """Export data as CSV"""
+    """Export data as CSV, streamed to the client as it is read"""
     if data_type not in ['atvs', 'parts', 'expenses', 'sales']:
         return redirect(url_for('atv.reports'))
 
-    # Create a string buffer for the CSV data
-    output = StringIO()
-    writer = csv.writer(output)
+    header, rows = export_rows(data_type, request.args)
+    filename = f'{data_type}_{datetime.now().strftime("%Y%m%d")}.csv'
 
-    if data_type == 'atvs':
-        # Write ATV data
-        writer.writerow(['ID', 'Make', 'Model', 'Year', 'VIN', 'Status', 'Purchase Date',
-                        'Purchase Price', 'Purchase Location', 'Description', 'Total Earnings'])
-        atvs = ATV.query.filter(ATV.status != 'deleted').all()
-        for atv in atvs:
-            writer.writerow([
-                atv.id, atv.make, atv.model, atv.year, atv.vin, atv.status,
-                atv.purchase_date.strftime('%Y-%m-%d') if atv.purchase_date else '',
-                atv.purchase_price, atv.purchase_location, atv.description, atv.total_earnings
-            ])
-    elif data_type == 'parts':
-        # Write Parts data
-        writer.writerow(['ID', 'ATV', 'Name', 'Part Number', 'Condition', 'Location',
-                        'Status', 'Source Price', 'List Price', 'Sold Price',
-                        'Sold Date', 'Platform', 'Listing URL', 'Description'])
-        parts = Part.query.join(ATV).filter(ATV.status != 'deleted').all()
-        for part in parts:
-            writer.writerow([
-                part.id, f"{part.atv.year} {part.atv.make} {part.atv.model}",
-                part.name, part.part_number, part.condition, part.location,
-                part.status, part.source_price, part.list_price, part.sold_price,
-                part.sold_date.strftime('%Y-%m-%d') if part.sold_date else '',
-                part.platform, part.listing_url, part.description
-            ])
-    elif data_type == 'expenses':
-        # Write Expenses data
-        writer.writerow(['ID', 'ATV', 'Date', 'Category', 'Amount', 'Description'])
-        expenses = Expense.query.join(ATV).filter(ATV.status != 'deleted').all()
-        for expense in expenses:
-            writer.writerow([
-                expense.id, f"{expense.atv.year} {expense.atv.make} {expense.atv.model}",
-                expense.date.strftime('%Y-%m-%d'), expense.category,
-                expense.amount, expense.description
-            ])
-    elif data_type == 'sales':
-        # Write Sales data
-        writer.writerow(['ID', 'ATV', 'Date', 'Type', 'Platform', 'Amount',
-                        'Fees', 'Shipping', 'Net Amount', 'Description'])
-        sales = Sale.query.join(ATV).filter(ATV.status != 'deleted').all()
-        for sale in sales:
-            writer.writerow([
-                sale.id, f"{sale.atv.year} {sale.atv.make} {sale.atv.model}",
-                sale.date.strftime('%Y-%m-%d'), sale.type, sale.platform,
-                sale.amount, sale.fees, sale.shipping_cost, sale.net_amount,
-                sale.description
-            ])
-
-    # Create the response
-    output.seek(0)
-    output_str = output.getvalue()
-    
-    # Convert to BytesIO for send_file
-    bytes_output = BytesIO(output_str.encode('utf-8'))
-    
-    return send_file(
-        bytes_output,
+    def generate():
+        # The rows are read while streaming, after this view has returned
+        with analytics_reads():
+            yield from stream_csv(header, rows)
+
+    return Response(
+        stream_with_context(generate()),
         mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'{data_type}_{datetime.now().strftime("%Y%m%d")}.csv'
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 def save_image(file, parent_type="atv", parent_id=None, image_type="general", description=""):
     """Save an uploaded image file and create database record"""
-    # Generate a unique filename
     original_filename = secure_filename(file.filename)
     extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
-    unique_filename = f"{uuid.uuid4().hex}.{extension}"
-    
-    # Create upload directory if it doesn't exist
-    uploads_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], parent_type, str(parent_id))
-    os.makedirs(uploads_dir, exist_ok=True)
-    
-    # Save the file
-    file_path = os.path.join(uploads_dir, unique_filename)
-    file.save(file_path)
-    
-    # Create database record
-    image = Image(
-        filename=unique_filename,
-        description=description,
-        image_type=image_type
-    )
     
     # Associate with either ATV or Part
-    if parent_type == 'atv':
-        image.atv_id = parent_id
-    elif parent_type == 'part':
-        image.part_id = parent_id
-        
-    db.session.add(image)
+    parent = {'atv_id': parent_id} if parent_type == 'atv' else {'part_id': parent_id}
+    
+    # Store the file and create the database record; resized copies are made after commit
+    image = add_uploaded_image(file, extension, description=description,
+                               image_type=image_type, **parent)
     db.session.commit()
     
     return image
@@ -601,21 +704,26 @@ def atv_images(id):
 
 @bp.route('/image/<int:id>')
 def view_image(id):
-    """View a single image"""
+    """View a single image (?size=thumb|medium|full for a resized copy)"""
     image = Image.query.get_or_404(id)
-    
-    # Determine the parent object
-    parent = None
-    if image.atv_id:
-        parent = ATV.query.get(image.atv_id)
-        parent_type = 'atv'
-    elif image.part_id:
-        parent = Part.query.get(image.part_id)
-        parent_type = 'part'
-    
-    image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], parent_type, str(parent.id), image.filename)
-    
-    return send_file(image_path)
+    path = image_file_path(image, request.args.get('size'))
+    if is_stored(image):
+        return redirect(url_for('atv.media', name=os.path.basename(path)))
+    return send_image(path)
+
+@bp.route('/media/<name>')
+def media(name):
+    """Serve a file from the image store by content-hash name; never touches the database"""
+    path = media_file_path(name)
+    if path is None:
+        abort(404)
+    if not os.path.isfile(path):
+        # A variant not generated yet under the current IMAGE_SIZES/VARIANT_QUALITY: use the original for now
+        original = stored_original_name(name[:64])
+        if original is None or original == name:
+            abort(404)
+        return redirect(url_for('atv.media', name=original))
+    return send_image(path, etag=name, immutable=True)
 
 @bp.route('/image/<int:id>/delete', methods=['POST'])
 def delete_image(id):
@@ -635,10 +743,8 @@ def delete_image(id):
         flash('Image not associated with any object.', 'error')
         return redirect(url_for('atv.index'))
     
-    # Delete the file from filesystem
-    image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], parent_type, str(parent_id), image.filename)
-    if os.path.exists(image_path):
-        os.remove(image_path)
+    # Delete the file and its variants from the filesystem
+    remove_image_files(image)
     
     # Delete from database
     db.session.delete(image)
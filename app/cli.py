@@ -0,0 +1,33 @@
+"""`flask amf ...` maintenance commands"""
+import click
+from datetime import timedelta
+from flask import current_app
+from flask.cli import AppGroup
+
+amf_cli = AppGroup('amf', help='AMF Motorsports maintenance commands.')
+
+@amf_cli.command('fix-schema')
+def fix_schema():
+    """Check and repair the database schema, whatever its recorded fingerprint."""
+    from app import ensure_database_schema, schema_fingerprint, schema_is_current
+    ensure_database_schema(current_app._get_current_object(), force=True)
+    fingerprint = schema_fingerprint()
+    if not schema_is_current(fingerprint):
+        raise click.ClickException("Schema repair had failed steps; see the log. The fingerprint was not recorded.")
+    click.echo(f"Schema check finished (models fingerprint {fingerprint[:12]}).")
+
+@amf_cli.command('process-images')
+@click.option('--older-than', default=10, show_default=True,
+              help='Only pick up images queued at least this many minutes ago.')
+def process_images(older_than):
+    """Process images whose background job was lost or failed."""
+    from app.utils.image_worker import process_stale_images
+    processed, failed = process_stale_images(current_app._get_current_object(), timedelta(minutes=older_than))
+    click.echo(f"Processed {processed} images ({failed} still failed).")
+
+@amf_cli.command('gc-images')
+def gc_images():
+    """Delete image store files that no image references any more."""
+    from app.utils.images import remove_unreferenced_store_files
+    removed = remove_unreferenced_store_files()
+    click.echo(f"Removed the files of {removed} unreferenced images.")
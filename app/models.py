@@ -1,5 +1,10 @@
 from app import db
 from datetime import datetime
+from itertools import chain
+from sqlalchemy import event, case, func, inspect
+from sqlalchemy.ext.hybrid import hybrid_method
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import NO_VALUE
 import json
 
 class Storage(db.Model):
@@ -33,6 +38,12 @@ class Storage(db.Model):
 
 class ATV(db.Model):
     __tablename__ = 'atv'
+    __table_args__ = (
+        db.Index('ix_atv_status', 'status'),
+        db.Index('ix_atv_parting_status_created_at', 'parting_status', 'created_at'),
+        db.Index('ix_atv_created_at', 'created_at'),
+        db.Index('ix_atv_purchase_date', 'purchase_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     make = db.Column(db.String(100), nullable=False)
@@ -62,6 +73,7 @@ class ATV(db.Model):
     parts = db.relationship('Part', backref='atv', lazy='dynamic', cascade='all, delete-orphan')
     sales = db.relationship('Sale', backref='atv', lazy='dynamic', cascade='all, delete-orphan')
     images = db.relationship('Image', backref='atv', lazy='dynamic', cascade='all, delete-orphan')
+    rollup = db.relationship('ATVRollup', backref='atv', uselist=False, cascade='all, delete-orphan')
 
     def __init__(self, **kwargs):
         super(ATV, self).__init__(**kwargs)
@@ -92,45 +104,89 @@ class ATV(db.Model):
         self.total_hours = self.acquisition_hours + self.repair_hours + self.selling_hours
         return self.total_hours
     
+    def _rollup_value(self, column):
+        """Read a financial total from the rollup row (0 if the ATV has none yet)"""
+        if self.rollup is None:
+            return 0
+        return getattr(self.rollup, column) or 0
+
+    @classmethod
+    def _rollup_expr(cls, column):
+        """A rollup column for ordering/filtering in SQL (0 if the ATV has no row yet).
+
+        The query must outer-join ATVRollup once, e.g.
+        ATV.query.outerjoin(ATV.rollup).order_by(ATV.profit_loss()).
+        """
+        return func.coalesce(getattr(ATVRollup, column), 0)
+
     def total_expenses(self):
         """Calculate total expenses including handling None values"""
-        return sum(expense.amount or 0 for expense in self.expenses)
+        return self._rollup_value('expenses_total')
 
     def total_sales(self):
         """Calculate total sales including handling None values"""
-        return sum(sale.amount or 0 for sale in self.sales)
+        return self._rollup_value('sales_total')
 
     def total_parts_value(self):
         """Calculate total value of parts based on their status"""
-        total = 0
-        for part in self.parts:
-            if part.status == 'sold':
-                total += part.sold_price or 0
-            else:
-                total += part.list_price or 0
-        return total
+        return self._rollup_value('parts_value')
 
+    @hybrid_method
     def parts_profit(self):
         """Calculate total profit from parts"""
-        return sum((part.net_profit() for part in self.parts if part.status == 'sold'), 0)
+        return self._rollup_value('parts_profit')
+
+    @parts_profit.expression
+    def parts_profit(cls):
+        return cls._rollup_expr('parts_profit')
+
+    def parts_count(self):
+        """Get the number of parts pulled from this ATV"""
+        return self._rollup_value('part_count')
+
+    def sold_parts_count(self):
+        """Get the number of parts from this ATV that have sold"""
+        return self._rollup_value('sold_part_count')
 
+    @hybrid_method
     def profit_loss(self):
         """Calculate total profit/loss including parts"""
         parts_profit = self.parts_profit()
         direct_profit = self.total_sales() - self.total_expenses() - (self.purchase_price or 0)
         return direct_profit + parts_profit
 
+    @profit_loss.expression
+    def profit_loss(cls):
+        return (cls._rollup_expr('sales_total') - cls._rollup_expr('expenses_total')
+                - func.coalesce(cls.purchase_price, 0) + cls._rollup_expr('parts_profit'))
+
     def total_profit(self):
         """Calculate total profit"""
         return self.total_earnings - self.purchase_price - self.total_expenses()
 
+    @hybrid_method
     def hourly_profit_rate(self):
         """Calculate profit per hour invested"""
         if self.total_hours is None or self.total_hours == 0:
             return 0
         return self.profit_loss() / self.total_hours
 
+    @hourly_profit_rate.expression
+    def hourly_profit_rate(cls):
+        return case(
+            (func.coalesce(cls.total_hours, 0) == 0, 0),
+            else_=cls.profit_loss() / cls.total_hours
+        )
+
 class Part(db.Model):
+    __table_args__ = (
+        db.Index('ix_part_status_sold_date', 'status', 'sold_date'),
+        db.Index('ix_part_atv_id_status', 'atv_id', 'status'),
+        db.Index('ix_part_tote', 'tote'),
+        db.Index('ix_part_storage_id', 'storage_id'),
+        db.Index('ix_part_created_at', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
     part_number = db.Column(db.String(64))
@@ -155,6 +211,7 @@ class Part(db.Model):
     listing_url = db.Column(db.String(256))  # URL to the listing
     listing_date = db.Column(db.DateTime)    # When the item was listed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Added missing created_at field
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Foreign keys
     atv_id = db.Column(db.Integer, db.ForeignKey('atv.id'))
@@ -176,7 +233,75 @@ class Part(db.Model):
         
         return self.sold_price - cost_basis - shipping - fees
 
+    @property
+    def primary_image(self):
+        """First image for this part; preloaded in bulk by load_primary_images()"""
+        if '_primary_image' not in self.__dict__:
+            self._primary_image = self.images.order_by(Image.id).first()
+        return self._primary_image
+
+    @classmethod
+    def value_expr(cls):
+        """SQL version of the per-part value used in ATV.total_parts_value()"""
+        return case(
+            (cls.status == 'sold', func.coalesce(cls.sold_price, 0)),
+            else_=func.coalesce(cls.list_price, 0)
+        )
+
+    @classmethod
+    def net_profit_expr(cls):
+        """SQL version of net_profit()"""
+        return case(
+            ((cls.status == 'sold') & (func.coalesce(cls.sold_price, 0) != 0),
+             cls.sold_price - func.coalesce(cls.source_price, 0)
+             - func.coalesce(cls.shipping_cost, 0) - func.coalesce(cls.platform_fees, 0)),
+            else_=0
+        )
+
+def load_primary_images(parts):
+    """Attach the first image of every part in the list with a single query"""
+    parts = list(parts)
+    part_ids = [part.id for part in parts]
+    images = {}
+    if part_ids:
+        first_image_ids = (
+            db.select(func.min(Image.id))
+            .where(Image.part_id.in_(part_ids))
+            .group_by(Image.part_id)
+        )
+        images = {image.part_id: image for image in Image.query.filter(Image.id.in_(first_image_ids))}
+    for part in parts:
+        part._primary_image = images.get(part.id)
+    return parts
+
+PART_STATUSES = ('in_stock', 'listed', 'reserved', 'sold')
+
+def part_status_summary(query):
+    """Count parts per status and total their value in a single query.
+
+    Uses conditional aggregates (SUM(CASE ...)) over any Part query, keeping
+    its joins and filters. Returns (status_counts, total_value) where
+    status_counts also has an 'all' key.
+    """
+    status_columns = [
+        func.coalesce(func.sum(case((Part.status == status, 1), else_=0)), 0)
+        for status in PART_STATUSES
+    ]
+    row = query.order_by(None).with_entities(
+        func.count(Part.id),
+        *status_columns,
+        func.coalesce(func.sum(Part.value_expr()), 0)
+    ).one()
+    status_counts = dict(zip(PART_STATUSES, row[1:-1]))
+    status_counts['all'] = row[0]
+    return status_counts, row[-1]
+
 class Expense(db.Model):
+    __table_args__ = (
+        db.Index('ix_expense_date', 'date'),
+        db.Index('ix_expense_atv_id', 'atv_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     amount = db.Column(db.Float)
@@ -184,6 +309,7 @@ class Expense(db.Model):
     description = db.Column(db.Text)
     atv_id = db.Column(db.Integer, db.ForeignKey('atv.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     @staticmethod
     def monthly_by_category(year, month):
@@ -198,6 +324,12 @@ class Expense(db.Model):
         return totals
 
 class Sale(db.Model):
+    __table_args__ = (
+        db.Index('ix_sale_type_date', 'type', 'date'),
+        db.Index('ix_sale_date', 'date'),
+        db.Index('ix_sale_atv_id', 'atv_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     amount = db.Column(db.Float)
@@ -209,22 +341,242 @@ class Sale(db.Model):
     atv_id = db.Column(db.Integer, db.ForeignKey('atv.id'))
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def calculate_net(self):
         self.net_amount = self.amount - (self.fees or 0) - (self.shipping_cost or 0)
 
 class Image(db.Model):
+    __table_args__ = (
+        db.Index('ix_image_part_id', 'part_id'),
+        db.Index('ix_image_atv_id', 'atv_id'),
+        db.Index('ix_image_content_hash', 'content_hash'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(256))
     atv_id = db.Column(db.Integer, db.ForeignKey('atv.id'))
     part_id = db.Column(db.Integer, db.ForeignKey('part.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     description = db.Column(db.Text)
     image_type = db.Column(db.String(64))  # 'general', 'vin', 'damage', etc.
+    processing_status = db.Column(db.String(20))  # pending, ready, failed; NULL for images uploaded before processing
+    content_hash = db.Column(db.String(64))  # SHA-256 of the original file; names it in the image store
     
+    @property
+    def variants_pending(self):
+        """True until the background worker has written this image's resized variants"""
+        return self.processing_status in ('pending', 'failed')
+
     def __repr__(self):
         return f"<Image {self.filename}>"
 
+class ATVRollup(db.Model):
+    """Per-ATV financial totals, kept current by the after_flush hook below"""
+    __tablename__ = 'atv_rollup'
+
+    atv_id = db.Column(db.Integer, db.ForeignKey('atv.id', ondelete='CASCADE'), primary_key=True)
+    expenses_total = db.Column(db.Float, default=0, nullable=False)
+    sales_total = db.Column(db.Float, default=0, nullable=False)
+    parts_value = db.Column(db.Float, default=0, nullable=False)
+    parts_profit = db.Column(db.Float, default=0, nullable=False)
+    sold_part_count = db.Column(db.Integer, default=0, nullable=False)
+    part_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ATVRollup atv={self.atv_id}>"
+
+# Columns that feed the rollup; changes to anything else don't trigger a refresh
+ROLLUP_TRACKED_COLUMNS = {
+    'Expense': ('atv_id', 'amount'),
+    'Sale': ('atv_id', 'amount'),
+    'Part': ('atv_id', 'status', 'sold_price', 'list_price', 'source_price',
+             'shipping_cost', 'platform_fees'),
+}
+
+def _empty_financials():
+    return {
+        'expenses_total': 0,
+        'sales_total': 0,
+        'parts_value': 0,
+        'parts_profit': 0,
+        'sold_part_count': 0,
+        'part_count': 0,
+    }
+
+def _atv_financials(atv_ids, connection=None):
+    """Aggregate the financial totals for the given ATV ids.
+
+    Runs one grouped query per child table (Expense, Sale, Part) no matter how
+    many ids are passed. Returns {atv_id: {column: value}} with an entry for
+    every requested id.
+    """
+    atv_ids = [atv_id for atv_id in set(atv_ids) if atv_id is not None]
+    totals = {atv_id: _empty_financials() for atv_id in atv_ids}
+    if not atv_ids:
+        return totals
+    execute = connection.execute if connection is not None else db.session.execute
+
+    expense_rows = execute(
+        db.select(Expense.atv_id, func.coalesce(func.sum(Expense.amount), 0))
+        .where(Expense.atv_id.in_(atv_ids))
+        .group_by(Expense.atv_id)
+    )
+    for atv_id, total in expense_rows:
+        totals[atv_id]['expenses_total'] = total
+
+    sale_rows = execute(
+        db.select(Sale.atv_id, func.coalesce(func.sum(Sale.amount), 0))
+        .where(Sale.atv_id.in_(atv_ids))
+        .group_by(Sale.atv_id)
+    )
+    for atv_id, total in sale_rows:
+        totals[atv_id]['sales_total'] = total
+
+    part_rows = execute(
+        db.select(
+            Part.atv_id,
+            func.coalesce(func.sum(Part.value_expr()), 0),
+            func.coalesce(func.sum(Part.net_profit_expr()), 0),
+            func.coalesce(func.sum(case((Part.status == 'sold', 1), else_=0)), 0),
+            func.count(Part.id)
+        )
+        .where(Part.atv_id.in_(atv_ids))
+        .group_by(Part.atv_id)
+    )
+    for atv_id, value, profit, sold, count in part_rows:
+        totals[atv_id].update(parts_value=value, parts_profit=profit,
+                              sold_part_count=sold, part_count=count)
+    return totals
+
+def refresh_atv_rollups(atv_ids, connection=None):
+    """Recompute and upsert the rollup rows for the given ATV ids.
+
+    The flush hooks below only see objects loaded into the session. Bulk
+    statements (Query.update()/delete(), Core insert/update/delete on the
+    expense, sale or part tables) bypass them, so callers must pass the
+    affected ATV ids here afterwards, or call rebuild_atv_rollups().
+    """
+    if connection is None:
+        connection = db.session.connection()
+    table = ATVRollup.__table__
+    now = datetime.utcnow()
+    for atv_id, values in _atv_financials(atv_ids, connection).items():
+        values['updated_at'] = now
+        result = connection.execute(
+            table.update().where(table.c.atv_id == atv_id).values(**values)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(atv_id=atv_id, **values))
+
+def rebuild_atv_rollups():
+    """Recompute the rollup for every ATV (backfill / after bulk imports)"""
+    atv_ids = [row[0] for row in db.session.execute(db.select(ATV.id))]
+    refresh_atv_rollups(atv_ids)
+    db.session.commit()
+    return len(atv_ids)
+
+def _loaded_atv_id(obj):
+    """The object's atv_id, loading it if the attribute was expired or deferred"""
+    atv_id = inspect(obj).attrs.atv_id.loaded_value
+    return obj.atv_id if atv_id is NO_VALUE else atv_id
+
+def _rollup_atv_ids(session):
+    """Collect the ATV ids whose rollup is affected by the pending flush"""
+    touched = session.info.pop('deleted_rollup_atv_ids', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        columns = ROLLUP_TRACKED_COLUMNS.get(type(obj).__name__)
+        if columns is None:
+            continue
+        state = inspect(obj)
+        if obj in session.deleted:
+            # The row is gone now; its atv_id was loaded before the flush if it was expired
+            atv_id = state.attrs.atv_id.loaded_value
+            touched.add(None if atv_id is NO_VALUE else atv_id)
+        elif obj in session.dirty and not any(state.attrs[c].history.has_changes() for c in columns):
+            continue
+        else:
+            touched.add(_loaded_atv_id(obj))
+        touched.update(state.attrs.atv_id.history.deleted)
+    touched.update(obj.id for obj in session.new if isinstance(obj, ATV))
+    touched.difference_update(obj.id for obj in session.deleted if isinstance(obj, ATV))
+    touched.discard(None)
+    return touched
+
+def _load_previous_atv(target, value, oldvalue, initiator):
+    # Registering with active_history loads the previous atv_id on set, even
+    # when it was expired, so moving a row also refreshes the ATV it left
+    pass
+
+for _model in (Expense, Sale, Part):
+    event.listen(_model.atv_id, 'set', _load_previous_atv, active_history=True)
+
+@event.listens_for(Session, 'before_flush')
+def _load_deleted_rollup_atv_ids(session, flush_context, instances):
+    # Deleted rows can't be loaded after the flush, so read an expired atv_id now
+    atv_ids = {_loaded_atv_id(obj) for obj in session.deleted
+               if type(obj).__name__ in ROLLUP_TRACKED_COLUMNS}
+    session.info.setdefault('deleted_rollup_atv_ids', set()).update(atv_ids)
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_rollups_after_flush(session, flush_context):
+    atv_ids = _rollup_atv_ids(session)
+    if atv_ids:
+        refresh_atv_rollups(atv_ids, session.connection())
+        session.info.setdefault('stale_rollups', set()).update(atv_ids)
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_stale_rollups(session, flush_context):
+    # Rollup rows were written with Core, so drop any copies already loaded
+    for atv_id in session.info.pop('stale_rollups', ()):
+        rollup = session.identity_map.get(session.identity_key(ATVRollup, atv_id))
+        if rollup is not None:
+            session.expire(rollup)
+        atv = session.identity_map.get(session.identity_key(ATV, atv_id))
+        if atv is not None:
+            session.expire(atv, ['rollup'])
+
+class BackupTombstone(db.Model):
+    """A deleted row, recorded so incremental backups can replay the delete"""
+    __tablename__ = 'backup_tombstone'
+    __table_args__ = (
+        db.Index('ix_backup_tombstone_deleted_at', 'deleted_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<BackupTombstone {self.table_name}:{self.row_id}>"
+
+class SchemaVersion(db.Model):
+    """Fingerprint of the schema the database was last checked and repaired against (single row)"""
+    __tablename__ = 'schema_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SchemaVersion {self.fingerprint[:12]}>"
+
+# Models whose deletes are recorded for incremental backups
+TOMBSTONE_MODELS = (Storage, ATV, Part, Image, Expense, Sale)
+
+@event.listens_for(Session, 'after_flush')
+def _record_tombstones(session, flush_context):
+    now = datetime.utcnow()
+    rows = [
+        {'table_name': obj.__table__.name, 'row_id': inspect(obj).identity[0], 'deleted_at': now}
+        for obj in session.deleted if isinstance(obj, TOMBSTONE_MODELS)
+    ]
+    if rows:
+        session.connection().execute(BackupTombstone.__table__.insert(), rows)
+
 # eBay related models removed to simplify the application
 
 # EbayCredentials model removed
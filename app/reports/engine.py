@@ -0,0 +1,130 @@
+"""Report engine: grouped aggregate queries behind the financial and inventory reports"""
+from datetime import datetime
+from sqlalchemy import case, func
+from app import db
+from app.models import ATV, Part, Expense
+
+# Longest monthly series the financial report will build
+MAX_REPORT_MONTHS = 120
+
+def month_start(value):
+    """First instant of the calendar month containing `value`"""
+    return datetime(value.year, value.month, 1)
+
+def add_months(value, months):
+    """Shift a month-start datetime by a whole number of calendar months"""
+    index = value.year * 12 + (value.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def _month_buckets(column):
+    """GROUP BY expressions for the calendar year and month of a date column"""
+    return func.extract('year', column), func.extract('month', column)
+
+def monthly_financials(months=6, now=None):
+    """Revenue, part costs and expenses per calendar month.
+
+    Runs one grouped query for Part and one for Expense, however many months
+    are requested, and returns a dense series (months with no activity are
+    zero-filled) ordered newest first.
+    """
+    current = month_start(now or datetime.utcnow())
+    start = add_months(current, -(months - 1))
+    end = add_months(current, 1)
+
+    part_year, part_month = _month_buckets(Part.sold_date)
+    part_rows = db.session.query(
+        part_year, part_month,
+        func.coalesce(func.sum(Part.sold_price), 0),
+        func.coalesce(func.sum(
+            func.coalesce(Part.source_price, 0)
+            + func.coalesce(Part.shipping_cost, 0)
+            + func.coalesce(Part.platform_fees, 0)
+        ), 0)
+    ).filter(
+        Part.status == 'sold',
+        Part.sold_date >= start,
+        Part.sold_date < end
+    ).group_by(part_year, part_month).all()
+
+    expense_year, expense_month = _month_buckets(Expense.date)
+    expense_rows = db.session.query(
+        expense_year, expense_month,
+        func.coalesce(func.sum(Expense.amount), 0)
+    ).filter(
+        Expense.date >= start,
+        Expense.date < end
+    ).group_by(expense_year, expense_month).all()
+
+    parts_by_month = {(int(y), int(m)): (revenue, cost) for y, m, revenue, cost in part_rows}
+    expenses_by_month = {(int(y), int(m)): total for y, m, total in expense_rows}
+
+    series = []
+    for offset in range(months):
+        month = add_months(current, -offset)
+        key = (month.year, month.month)
+        revenue, parts_cost = parts_by_month.get(key, (0, 0))
+        expenses = expenses_by_month.get(key, 0)
+        total_costs = parts_cost + expenses
+        series.append({
+            'month': month.strftime('%B %Y'),
+            'month_obj': month,
+            'revenue': revenue,
+            'parts_cost': parts_cost,
+            'expenses': expenses,
+            'total_costs': total_costs,
+            'profit': revenue - total_costs
+        })
+    return series
+
+# Sort options for the per-ATV inventory table
+INVENTORY_SORTS = ('default', 'completion', 'earnings', 'revenue')
+
+def atv_inventory_stats(sort_by='default'):
+    """Per-ATV part counts and values for every non-deleted ATV.
+
+    One LEFT JOIN + GROUP BY over ATV and Part returns total, sold and listed
+    part counts, in-stock value (list price of in-stock/listed parts) and
+    sold revenue. Sorting by completion or earnings happens in SQL.
+    """
+    total_parts = func.count(Part.id)
+    parts_sold = func.coalesce(func.sum(case((Part.status == 'sold', 1), else_=0)), 0)
+    in_stock_value = func.coalesce(func.sum(case(
+        (Part.status.in_(['in_stock', 'listed']), func.coalesce(Part.list_price, 0)), else_=0
+    )), 0)
+    sold_revenue = func.coalesce(func.sum(case(
+        (Part.status == 'sold', func.coalesce(Part.sold_price, 0)), else_=0
+    )), 0)
+    completion = case((total_parts == 0, 0), else_=parts_sold * 100.0 / total_parts)
+
+    query = db.session.query(
+        ATV.id, ATV.year, ATV.make, ATV.model, ATV.total_earnings,
+        total_parts.label('total_parts'),
+        parts_sold.label('parts_sold'),
+        func.coalesce(func.sum(case((Part.status == 'listed', 1), else_=0)), 0).label('parts_listed'),
+        in_stock_value.label('in_stock_value'),
+        sold_revenue.label('sold_revenue'),
+        completion.label('completion')
+    ).outerjoin(Part, Part.atv_id == ATV.id).filter(
+        ATV.status != 'deleted'
+    ).group_by(ATV.id)
+
+    if sort_by == 'completion':
+        query = query.order_by(completion.desc(), ATV.id.asc())
+    elif sort_by == 'earnings':
+        query = query.order_by(func.coalesce(ATV.total_earnings, 0).desc(), ATV.id.asc())
+    elif sort_by == 'revenue':
+        query = query.order_by(sold_revenue.desc(), ATV.id.asc())
+    else:
+        query = query.order_by(ATV.id.asc())
+
+    return [{
+        'id': row.id,
+        'name': f'{row.year} {row.make} {row.model}',
+        'total_parts': row.total_parts,
+        'parts_sold': row.parts_sold,
+        'parts_listed': row.parts_listed,
+        'in_stock_value': row.in_stock_value,
+        'sold_revenue': row.sold_revenue,
+        'completion': row.completion,
+        'total_earnings': row.total_earnings or 0
+    } for row in query.all()]
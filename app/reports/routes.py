@@ -1,8 +1,10 @@
 """Routes for generating reports"""
-from flask import render_template
+from flask import render_template, request
 from app.reports import bp
-from app.models import ATV, Part, Expense
+from app.reports.engine import monthly_financials, atv_inventory_stats, MAX_REPORT_MONTHS, INVENTORY_SORTS
+from app.models import ATV, Part, Expense, part_status_summary
 from app import db
+from app.utils.replica import uses_analytics_db
 from sqlalchemy import func
 from datetime import datetime, timedelta
 
@@ -12,6 +14,7 @@ def index():
     return render_template('reports/index.html')
 
 @bp.route('/reports/financial')
+@uses_analytics_db
 def financial():
     """Financial reports"""
     # Overall summary
@@ -25,58 +28,11 @@ def financial():
     total_costs = total_parts_cost + total_shipping + total_fees + total_expenses
     total_profit = total_revenue - total_costs
 
-    # Monthly breakdown - more accurate calculation using calendar months
-    now = datetime.utcnow()
-    months = []
-    current_month_data = None  # Store current month data separately
-    
-    for i in range(6):  # Last 6 months
-        # Get first day of the month
-        start_date = (now - timedelta(days=30*i)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # Get last day of the month more accurately
-        if start_date.month == 12:
-            end_date = datetime(start_date.year + 1, 1, 1) - timedelta(seconds=1)
-        else:
-            end_date = datetime(start_date.year, start_date.month + 1, 1) - timedelta(seconds=1)
-        
-        # Monthly revenue
-        month_revenue = db.session.query(func.sum(Part.sold_price))\
-            .filter(Part.status == 'sold')\
-            .filter(Part.sold_date.between(start_date, end_date))\
-            .scalar() or 0
-        
-        # Monthly part-specific costs
-        month_parts_cost = db.session.query(
-            func.sum(Part.source_price + Part.shipping_cost + Part.platform_fees)
-        ).filter(Part.status == 'sold')\
-         .filter(Part.sold_date.between(start_date, end_date))\
-         .scalar() or 0
-         
-        # Monthly general expenses
-        month_expenses = db.session.query(func.sum(Expense.amount))\
-            .filter(Expense.date.between(start_date, end_date))\
-            .scalar() or 0
-            
-        # Calculate monthly profit
-        month_total_costs = month_parts_cost + month_expenses
-        month_profit = month_revenue - month_total_costs
-        
-        month_data = {
-            'month': start_date.strftime('%B %Y'),
-            'month_obj': start_date,
-            'revenue': month_revenue,
-            'parts_cost': month_parts_cost,
-            'expenses': month_expenses,
-            'total_costs': month_total_costs,
-            'profit': month_profit
-        }
-        
-        # Store current month separately for highlighting in the UI
-        if i == 0:
-            current_month_data = month_data
-        
-        months.append(month_data)
+    # Monthly breakdown by calendar month (one grouped query per table)
+    month_count = request.args.get('months', 6, type=int)
+    month_count = max(1, min(month_count, MAX_REPORT_MONTHS))
+    months = monthly_financials(month_count)
+    current_month_data = months[0]  # Current month, highlighted in the UI
 
     # Get expense categories breakdown
     expense_categories = db.session.query(
@@ -106,6 +62,7 @@ def financial():
                          total_costs=total_costs,
                          total_profit=total_profit,
                          months=months,
+                         month_count=month_count,
                          current_month=current_month_data,
                          today=datetime.utcnow(),
                          current_month_name=datetime.utcnow().strftime('%B %Y'),
@@ -113,13 +70,11 @@ def financial():
                          current_month_expenses=current_month_expenses)
 
 @bp.route('/reports/inventory')
+@uses_analytics_db
 def inventory():
     """Inventory reports"""
     # Overall inventory stats
-    total_parts = Part.query.count()
-    parts_in_stock = Part.query.filter_by(status='in_stock').count()
-    parts_listed = Part.query.filter_by(status='listed').count()
-    parts_sold = Part.query.filter_by(status='sold').count()
+    status_counts, _ = part_status_summary(Part.query)
     
     # Value of current inventory
     inventory_value = db.session.query(func.sum(Part.list_price))\
@@ -127,29 +82,16 @@ def inventory():
         .scalar() or 0
     
     # Parts by ATV
-    atvs = ATV.query.filter(ATV.status != 'deleted').all()
-    atv_stats = []
-    for atv in atvs:
-        total = atv.parts.count()
-        sold = atv.parts.filter_by(status='sold').count()
-        if total > 0:
-            completion = (sold / total) * 100
-        else:
-            completion = 0
-            
-        atv_stats.append({
-            'name': f'{atv.year} {atv.make} {atv.model}',
-            'total_parts': total,
-            'parts_sold': sold,
-            'completion': completion,
-            'id': atv.id,
-            'total_earnings': atv.total_earnings or 0
-        })
+    sort_by = request.args.get('sort_by', 'default')
+    if sort_by not in INVENTORY_SORTS:
+        sort_by = 'default'
+    atv_stats = atv_inventory_stats(sort_by)
 
     return render_template('reports/inventory.html',
-                         total_parts=total_parts,
-                         parts_in_stock=parts_in_stock,
-                         parts_listed=parts_listed,
-                         parts_sold=parts_sold,
+                         total_parts=status_counts['all'],
+                         parts_in_stock=status_counts['in_stock'],
+                         parts_listed=status_counts['listed'],
+                         parts_sold=status_counts['sold'],
                          inventory_value=inventory_value,
-                         atv_stats=atv_stats)
+                         atv_stats=atv_stats,
+                         sort_by=sort_by)
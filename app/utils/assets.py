@@ -0,0 +1,97 @@
+"""Static assets: the hashed, precompressed build served by WhiteNoise.
+
+scripts/build_static.py copies app/static (minus uploads) into
+STATIC_BUILD_FOLDER, adds a content-hashed copy of each file
+(css/style.3f2a9c1d7e54.css), writes .gz/.br variants next to them and a
+manifest mapping source names to hashed names. Templates link assets
+through asset_url(), so a changed file gets a new URL and unchanged ones
+can be cached by browsers indefinitely.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from flask import current_app, url_for
+
+MANIFEST_NAME = 'manifest.json'
+# Directories under app/static that are user data rather than assets
+EXCLUDED_DIRECTORIES = ('uploads',)
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+def hashed_name(name, content):
+    """css/style.css -> css/style.<12 hex of md5>.css"""
+    stem, dot, extension = name.rpartition('.')
+    digest = hashlib.md5(content).hexdigest()[:12]
+    return f"{stem}.{digest}.{extension}" if dot else f"{name}.{digest}"
+
+def build_static(source, target):
+    """Write the hashed and compressed asset build for `source` into `target`.
+
+    The build goes to a sibling directory that replaces `target` at the end,
+    so a running server never sees a half-written build. Returns the manifest.
+    """
+    from whitenoise.compress import Compressor
+
+    staging = target.rstrip(os.sep) + '.partial'
+    shutil.rmtree(staging, ignore_errors=True)
+    manifest = {}
+    written = []
+    for root, directories, files in os.walk(source):
+        if root == source:
+            directories[:] = [d for d in directories if d not in EXCLUDED_DIRECTORIES]
+        for filename in files:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                content = f.read()
+            manifest[name] = hashed_name(name, content)
+            # Keep the plain name too, for anything that links it directly
+            for output_name in (name, manifest[name]):
+                output_path = os.path.join(staging, *output_name.split('/'))
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                with open(output_path, 'wb') as out:
+                    out.write(content)
+                written.append(output_path)
+
+    compressor = Compressor(quiet=True)
+    for path in written:
+        if compressor.should_compress(path):
+            for _ in compressor.compress(path):
+                pass
+
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    return manifest
+
+def _is_hashed(path, url):
+    return bool(HASHED_NAME.search(url))
+
+def init_static(app):
+    """Serve the asset build with WhiteNoise and load its manifest.
+
+    Skipped in debug mode, or if the build hasn't been run, so that edits to
+    app/static show up straight away; asset_url() then returns plain URLs.
+    """
+    app.add_template_global(asset_url)
+    build_folder = app.config.get('STATIC_BUILD_FOLDER')
+    manifest_path = os.path.join(build_folder, MANIFEST_NAME) if build_folder else None
+    if app.debug or not manifest_path or not os.path.exists(manifest_path):
+        return
+
+    from whitenoise import WhiteNoise
+
+    with open(manifest_path) as f:
+        app.extensions['static_manifest'] = json.load(f)
+    # Files WhiteNoise doesn't have (uploads) fall through to Flask's static route
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root=build_folder, prefix=app.static_url_path,
+                              immutable_file_test=_is_hashed)
+    app.logger.info(f"Serving {len(app.extensions['static_manifest'])} static assets from {build_folder}")
+
+def asset_url(filename):
+    """URL for a static asset, using its hashed name when a build is being served (template global)"""
+    manifest = current_app.extensions.get('static_manifest', {})
+    return url_for('static', filename=manifest.get(filename, filename))
@@ -0,0 +1,94 @@
+"""gzip/brotli compression for the app's own text responses.
+
+An after_request hook compresses HTML, JSON, CSV and other text bodies when
+the client accepts it, preferring brotli (if the Brotli package is
+installed) over gzip. Buffered bodies under COMPRESS_MIN_SIZE are sent as
+they are. Streamed responses such as the CSV exports are compressed chunk
+by chunk, each chunk flushed so the download still arrives progressively.
+Files from send_file (images, backups) and WhiteNoise assets are left alone.
+"""
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+)
+
+def _encodings():
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+class _GzipStream:
+    def __init__(self, level):
+        # wbits=31: zlib deflate with a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+def _compress_chunks(chunks, stream):
+    for chunk in chunks:
+        if chunk:
+            yield stream.compress(chunk)
+    yield stream.finish()
+
+def compress_response(response, config):
+    """Compress a response in place if the request and content type allow it"""
+    if (response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(_encodings())
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        stream = _BrotliStream(config['COMPRESS_BR_QUALITY'])
+    else:
+        stream = _GzipStream(config['COMPRESS_LEVEL'])
+
+    if response.is_streamed:
+        body = response.response
+        response.response = _compress_chunks(response.iter_encoded(), stream)
+        # The server now closes the compressing generator, so close the original body too
+        if hasattr(body, 'close'):
+            response.call_on_close(body.close)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(stream.compress(data) + stream.finish())
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is a different representation of the resource
+    tag, weak = response.get_etag()
+    if tag and not weak:
+        response.set_etag(tag, weak=True)
+    return response
+
+def init_compression(app):
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, app.config)
@@ -1,365 +1,489 @@
 """Utilities for managing data backup and restore"""
+import gzip
 import json
-from datetime import datetime, date
+import sqlite3
+import time
+from datetime import datetime, date, timedelta
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
 import os
-from app.models import ATV, Part, Image, Storage, Expense, Sale
+from sqlalchemy import func
+from app.models import ATV, Part, Image, Storage, Expense, Sale, ATVRollup, BackupTombstone, rebuild_atv_rollups
 from app import db
 
-# Helper function to format datetime objects
-def _format_date(date_obj):
-    if date_obj is None:
-        return None
-    if isinstance(date_obj, (datetime, date)):
-        return date_obj.strftime('%Y-%m-%d')
-    return str(date_obj)
+# Backup file format written by export_data
+BACKUP_FORMAT = 'amf-backup'
+BACKUP_VERSION = 2
+BACKUP_BATCH_SIZE = 1000
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Deltas start this far before the previous backup so rows written while it ran aren't missed
+BACKUP_OVERLAP = timedelta(minutes=1)
+
+# File in the backups directory recording when data was last restored
+RESTORE_MARKER = '.last_restore'
+
+# SQLite snapshots are stored next to the JSON backups
+SNAPSHOT_EXTENSION = '.sqlite3'
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+# Backup sections in restore (dependency) order
+BACKUP_TABLES = [
+    ('storages', Storage),
+    ('atvs', ATV),
+    ('parts', Part),
+    ('images', Image),
+    ('expenses', Expense),
+    ('sales', Sale),
+]
+
+def backup_dir():
+    """Directory backups are written to and listed from"""
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'backups')
+
+def _serialize_value(value):
+    """json default= hook for the values json can't encode natively"""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+_encoder = json.JSONEncoder(separators=(',', ':'), default=_serialize_value)
+
+def _encode_line(obj):
+    return _encoder.encode(obj) + '\n'
+
+def _backup_statement(model, since=None):
+    """Select every column of a model's table, optionally only rows changed since a time"""
+    table = model.__table__
+    statement = db.select(*table.columns).order_by(table.c.id)
+    if since is not None:
+        statement = statement.where(func.coalesce(table.c.updated_at, table.c.created_at) >= since)
+    return statement
+
+def export_data(export_path=None, incremental=False):
+    """Export data from the application to a compressed backup file.
 
-def export_data(export_path=None):
-    """Export all data from the application to a JSON file"""
+    The backup is gzip-compressed JSON lines: a manifest line describing
+    each section (columns and row count), then for every section a marker
+    line followed by one JSON array per row. Rows are read in
+    BACKUP_BATCH_SIZE batches and written as they arrive, so memory use
+    does not grow with the size of the database. The file is written under
+    a temporary name and moved into place once complete.
+
+    With incremental=True the backup is a delta against the latest backup
+    in the backups directory: only rows created or updated since that
+    backup was taken, plus tombstones for rows deleted since then. A full
+    backup is written instead if there is nothing to chain from.
+    """
+    base = latest_backup() if incremental else None
+    since = None
+    if base is not None:
+        since = _parse_datetime(read_backup_manifest(base)['created_at']) - BACKUP_OVERLAP
+    
     if export_path is None:
         # Create a backup directory if it doesn't exist
-        backup_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
+        os.makedirs(backup_dir(), exist_ok=True)
         
         # Generate filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        export_path = os.path.join(backup_dir, f'backup_{timestamp}.json')
-    
-    # Helper function to serialize objects to JSON
-    def serialize(obj):
-        if isinstance(obj, (datetime, date)):
-            return obj.strftime('%Y-%m-%d %H:%M:%S')
-        return str(obj)
-    
-    data = {
-        'atvs': [],
-        'parts': [],
-        'images': [],
-        'storages': [],
-        'expenses': [],
-        'sales': []
-    }
+        suffix = '_delta' if base is not None else ''
+        export_path = os.path.join(backup_dir(), f'backup_{timestamp}{suffix}.json.gz')
+        counter = 1
+        while os.path.exists(export_path):
+            counter += 1
+            export_path = os.path.join(backup_dir(), f'backup_{timestamp}{suffix}_{counter}.json.gz')
     
-    # Export ALL ATVs including deleted ones
-    for atv in ATV.query.all():
-        atv_data = {
-            'id': atv.id,
-            'make': atv.make,
-            'model': atv.model,
-            'year': atv.year,
-            'vin': atv.vin,  # Add the VIN field
-            'status': atv.status,
-            'purchase_date': _format_date(atv.purchase_date),
-            'purchase_price': atv.purchase_price,
-            'purchase_location': atv.purchase_location,
-            'description': atv.description,
-            'total_earnings': getattr(atv, 'total_earnings', None),
-            # Add hours tracking fields
-            'acquisition_hours': getattr(atv, 'acquisition_hours', 0),
-            'repair_hours': getattr(atv, 'repair_hours', 0),
-            'selling_hours': getattr(atv, 'selling_hours', 0),
-            'total_hours': getattr(atv, 'total_hours', 0),
-            'created_at': serialize(atv.created_at),
-            'updated_at': serialize(atv.updated_at)
-        }
-        data['atvs'].append(atv_data)
+    created_at = datetime.utcnow()
+    sections = []
+    if since is not None:
+        # Deletes are replayed before the upserts, so tombstones go first
+        tombstones = BackupTombstone.__table__
+        sections.append(('tombstones', db.select(
+            tombstones.c.table_name, tombstones.c.row_id, tombstones.c.deleted_at
+        ).where(tombstones.c.deleted_at >= since).order_by(tombstones.c.id)))
+    for name, model in BACKUP_TABLES:
+        sections.append((name, _backup_statement(model, since)))
     
-    # Export Parts
-    for part in Part.query.all():
-        part_data = {
-            'id': part.id,
-            'name': part.name,
-            'part_number': part.part_number,
-            'condition': part.condition,
-            'location': part.location,
-            'storage_id': part.storage_id,
-            'status': part.status,
-            'source_price': part.source_price,
-            'list_price': part.list_price,
-            'sold_price': part.sold_price,
-            'sold_date': serialize(part.sold_date) if part.sold_date else None,
-            'shipping_cost': part.shipping_cost,
-            'platform_fees': part.platform_fees,
-            'platform': part.platform,
-            'listing_url': part.listing_url,
-            'atv_id': part.atv_id,
-            'description': part.description,
-            'created_at': serialize(part.created_at),
-            'updated_at': serialize(part.updated_at)
-        }
-        data['parts'].append(part_data)
+    tables = []
+    for name, statement in sections:
+        rows = db.session.execute(db.select(func.count()).select_from(statement.subquery())).scalar()
+        tables.append({'name': name, 'columns': [c.name for c in statement.selected_columns], 'rows': rows})
     
-    # Export Images
-    for image in Image.query.all():
-        image_data = {
-            'id': image.id,
-            'filename': image.filename,
-            'atv_id': image.atv_id,
-            'part_id': image.part_id,
-            'created_at': serialize(image.created_at),
-            'description': image.description,
-            'image_type': getattr(image, 'image_type', 'general')  # Add the image_type field
-        }
-        data['images'].append(image_data)
-    
-    # Export Storage Locations
-    for storage in Storage.query.all():
-        storage_data = {
-            'id': storage.id,
-            'name': storage.name,
-            'description': storage.description,
-            'created_at': serialize(storage.created_at),
-            'updated_at': serialize(storage.updated_at)
-        }
-        data['storages'].append(storage_data)
-    
-    # Export Expenses
-    for expense in Expense.query.all():
-        expense_data = {
-            'id': expense.id,
-            'date': serialize(expense.date) if expense.date else None,
-            'amount': expense.amount,
-            'category': expense.category,
-            'description': expense.description,
-            'atv_id': expense.atv_id,
-            'created_at': serialize(expense.created_at)
-        }
-        data['expenses'].append(expense_data)
+    manifest = {
+        'format': BACKUP_FORMAT,
+        'version': BACKUP_VERSION,
+        'compression': 'gzip',
+        'kind': 'delta' if since is not None else 'full',
+        'created_at': created_at.isoformat(sep=' '),
+        'since': since.isoformat(sep=' ') if since is not None else None,
+        'base': os.path.basename(base) if base is not None else None,
+        'tables': tables
+    }
     
-    # Export Sales
-    for sale in Sale.query.all():
-        sale_data = {
-            'id': sale.id,
-            'date': serialize(sale.date) if sale.date else None,
-            'amount': sale.amount,
-            'platform': sale.platform,
-            'fees': sale.fees,
-            'shipping_cost': sale.shipping_cost,
-            'net_amount': sale.net_amount,
-            'type': sale.type,
-            'atv_id': sale.atv_id,
-            'description': sale.description,
-            'created_at': serialize(sale.created_at)
-        }
-        data['sales'].append(sale_data)
+    temp_path = export_path + '.partial'
+    try:
+        with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(_encode_line(manifest))
+            for name, statement in sections:
+                f.write(_encode_line({'table': name}))
+                result = db.session.execute(statement.execution_options(yield_per=BACKUP_BATCH_SIZE))
+                for batch in result.partitions():
+                    f.write(''.join(_encode_line(tuple(row)) for row in batch))
+        os.replace(temp_path, export_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
     
-    # Save to file
-    with open(export_path, 'w') as f:
-        json.dump(data, f, indent=2)
+    if since is None:
+        # A full backup covers every earlier delete
+        BackupTombstone.query.filter(BackupTombstone.deleted_at < created_at - BACKUP_OVERLAP).delete()
+        db.session.commit()
     
     return export_path
 
-def import_data(import_path, clear_existing=False):
-    """Import data from a JSON file"""
-    # Read the JSON file
-    with open(import_path, 'r') as f:
-        data = json.load(f)
-    
-    # Ensure purchase_date is properly formatted
-    for atv_data in data.get('atvs', []):
-        if 'purchase_date' in atv_data and atv_data['purchase_date']:
-            # Handle various date formats
-            try:
-                if isinstance(atv_data['purchase_date'], str):
-                    # Try parsing different formats
-                    for fmt in ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']:
-                        try:
-                            atv_data['purchase_date'] = datetime.strptime(atv_data['purchase_date'], fmt).date()
-                            break
-                        except ValueError:
-                            continue
-            except Exception as e:
-                print(f"Error parsing purchase_date: {e}")
-                atv_data['purchase_date'] = datetime.now().date()
-    
-    if clear_existing:
-        # Drop all existing data by deleting all records instead of dropping tables
-        # This avoids conflicts with the automatic table creation
+def is_backup_file(filename):
+    """Whether a filename looks like a backup (compressed or legacy JSON, or a SQLite snapshot)"""
+    return filename.endswith('.json.gz') or filename.endswith('.json') or is_snapshot_file(filename)
+
+def is_snapshot_file(filename):
+    return filename.endswith(SNAPSHOT_EXTENSION)
+
+def _mark_restored():
+    """Record the restore so later incremental backups don't chain from older backups"""
+    os.makedirs(backup_dir(), exist_ok=True)
+    with open(os.path.join(backup_dir(), RESTORE_MARKER), 'w') as f:
+        f.write(datetime.utcnow().isoformat(sep=' '))
+
+def read_backup_manifest(path):
+    """Return the manifest of a compressed backup, or None for a legacy JSON backup"""
+    with open(path, 'rb') as f:
+        if f.read(2) != GZIP_MAGIC:
+            return None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.loads(f.readline())
+
+def latest_backup():
+    """Path of the most recent compressed backup to chain a delta from, or None.
+
+    Returns None if data has been restored since that backup was taken, as
+    the database no longer matches the chain.
+    """
+    directory = backup_dir()
+    if not os.path.isdir(directory):
+        return None
+    latest, latest_created = None, None
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json.gz'):
+            continue
+        path = os.path.join(directory, filename)
         try:
+            manifest = read_backup_manifest(path)
+        except (OSError, ValueError):
+            continue
+        if not manifest or manifest.get('format') != BACKUP_FORMAT:
+            continue
+        created = _parse_datetime(manifest.get('created_at'))
+        if created is not None and (latest_created is None or created > latest_created):
+            latest, latest_created = path, created
+    
+    marker = os.path.join(directory, RESTORE_MARKER)
+    if latest is not None and os.path.exists(marker):
+        with open(marker) as f:
+            restored_at = _parse_datetime(f.read().strip())
+        if restored_at is None or restored_at >= latest_created:
+            return None
+    return latest
+
+def backup_chain(path):
+    """The backups needed to restore `path`: its full backup followed by each delta in order"""
+    chain = [path]
+    manifest = read_backup_manifest(path)
+    while manifest is not None and manifest.get('kind') == 'delta':
+        base = os.path.join(os.path.dirname(path), manifest['base'])
+        if not os.path.exists(base) or base in chain:
+            raise ValueError(f"Backup {os.path.basename(chain[0])} needs missing base backup {manifest['base']}")
+        chain.insert(0, base)
+        manifest = read_backup_manifest(base)
+    return chain
+
+def iter_backup_rows(path):
+    """Yield (table name, row dict) pairs from a compressed backup, in file order"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        manifest = json.loads(f.readline())
+        if manifest.get('format') != BACKUP_FORMAT:
+            raise ValueError('Not an AMF backup file')
+        columns = {table['name']: table['columns'] for table in manifest['tables']}
+        
+        section = names = None
+        for line in f:
+            value = json.loads(line)
+            if isinstance(value, dict):
+                section = value['table']
+                names = columns[section]
+            else:
+                yield section, dict(zip(names, value))
+
+def iter_backup_sections(path):
+    """Yield (table name, row dict iterable) for each table in a backup.
+
+    Compressed backups are streamed; legacy JSON backups are loaded whole.
+    Each iterable must be consumed before asking for the next section.
+    """
+    if read_backup_manifest(path) is None:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        for name, _ in BACKUP_TABLES:
+            yield name, data.get(name, [])
+        return
+    for name, rows in groupby(iter_backup_rows(path), key=itemgetter(0)):
+        yield name, (row for _, row in rows)
+
+# Rows inserted per executemany batch on restore
+RESTORE_BATCH_SIZE = 5000
+
+# Values ATV.__init__ fills in when missing; the bulk restore bypasses the constructor
+RESTORE_DEFAULTS = {
+    'atv': {
+        'acquisition_hours': 0,
+        'repair_hours': 0,
+        'selling_hours': 0,
+        'total_hours': 0,
+        'parting_status': 'whole'
+    }
+}
+
+def _parse_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def _parse_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value[:10])
+    except (TypeError, ValueError):
+        return None
+
+def _column_parsers(table):
+    """Map each column name to the function that converts its backup value"""
+    parsers = {}
+    for column in table.columns:
+        if isinstance(column.type, db.DateTime):
+            parsers[column.name] = _parse_datetime
+        elif isinstance(column.type, db.Date):
+            parsers[column.name] = _parse_date
+        else:
+            parsers[column.name] = None
+    return parsers
+
+def _scalar_defaults(table):
+    """Constant column defaults, for columns a backup row doesn't carry"""
+    return {column.name: column.default.arg for column in table.columns
+            if column.default is not None and column.default.is_scalar}
+
+def _write_batch(table, batch, upsert):
+    if not upsert:
+        db.session.execute(table.insert(), batch)
+        return
+    ids = [record['id'] for record in batch]
+    existing = set(db.session.execute(db.select(table.c.id).where(table.c.id.in_(ids))).scalars())
+    updates = [
+        dict({name: value for name, value in record.items() if name != 'id'}, _id=record['id'])
+        for record in batch if record['id'] in existing
+    ]
+    inserts = [record for record in batch if record['id'] not in existing]
+    if updates:
+        db.session.execute(table.update().where(table.c.id == db.bindparam('_id')), updates)
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+def _restore_table(table, rows, upsert=False):
+    """Write backup rows to a table in RESTORE_BATCH_SIZE batches, returning the row count.
+
+    Rows are bulk inserted, or with upsert=True (replaying a delta) rows
+    whose id already exists are updated instead.
+    """
+    parsers = _column_parsers(table)
+    missing = _scalar_defaults(table)
+    defaults = RESTORE_DEFAULTS.get(table.name, {})
+    batch = []
+    count = 0
+    for row in rows:
+        # Every row writes every column, so batches share one statement shape
+        # even when older backups left some keys out of some rows
+        record = {}
+        for name, parser in parsers.items():
+            value = row[name] if name in row else missing.get(name)
+            if parser is not None:
+                value = parser(value)
+            if value is None and name in defaults:
+                value = defaults[name]
+            record[name] = value
+        batch.append(record)
+        if len(batch) >= RESTORE_BATCH_SIZE:
+            _write_batch(table, batch, upsert)
+            count += len(batch)
+            batch = []
+    if batch:
+        _write_batch(table, batch, upsert)
+        count += len(batch)
+    return count
+
+def _apply_tombstones(rows):
+    """Delete the rows listed in a delta's tombstones, children before parents"""
+    deleted = {}
+    for row in rows:
+        deleted.setdefault(row['table_name'], set()).add(row['row_id'])
+    for _, model in reversed(BACKUP_TABLES):
+        ids = deleted.get(model.__table__.name)
+        if ids:
+            db.session.execute(model.__table__.delete().where(model.__table__.c.id.in_(ids)))
+            if model is ATV:
+                db.session.execute(ATVRollup.__table__.delete().where(ATVRollup.atv_id.in_(ids)))
+    return sum(len(ids) for ids in deleted.values())
+
+def reset_sequences(tables):
+    """Move PostgreSQL id sequences past the ids inserted by a restore"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table.name}"
+        ))
+
+def import_data(import_path, clear_existing=False):
+    """Restore data from a backup file (compressed or legacy JSON).
+
+    An incremental backup is restored by replaying its chain: the full
+    backup it builds on, then each delta in order (deletes first, then
+    upserts). Rows are written with batched executemany statements rather
+    than ORM objects, with each date column parsed once by fromisoformat.
+    The whole restore, including clearing existing data, runs in one
+    transaction. Returns {table name: (rows, rows per second)} summed over
+    the chain.
+    """
+    models = dict(BACKUP_TABLES)
+    stats = {}
+    try:
+        chain = backup_chain(import_path)
+        
+        if clear_existing:
             # Delete in reverse order of dependencies
             db.session.query(Sale).delete()
             db.session.query(Expense).delete()
             db.session.query(Image).delete()
             db.session.query(Part).delete()
+            db.session.query(ATVRollup).delete()
             db.session.query(ATV).delete()
             db.session.query(Storage).delete()
-            db.session.commit()
-            print("All existing data deleted successfully")
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error clearing database: {str(e)}")
-            raise
-    
-    try:
-        # Import Storage Locations first (they have no dependencies)
-        for storage_data in data['storages']:
-            storage = Storage(
-                id=storage_data['id'],
-                name=storage_data['name'],
-                description=storage_data['description']
-            )
-            if storage_data['created_at']:
-                storage.created_at = datetime.fromisoformat(storage_data['created_at'])
-            if storage_data['updated_at']:
-                storage.updated_at = datetime.fromisoformat(storage_data['updated_at'])
-            db.session.add(storage)
-        db.session.commit()
-        print(f"Imported {len(data['storages'])} storage locations")
-        
-        # Import ATVs
-        for atv_data in data['atvs']:
-            atv = ATV(
-                id=atv_data['id'],
-                make=atv_data['make'],
-                model=atv_data['model'],
-                year=atv_data['year'],
-                vin=atv_data.get('vin', ''),
-                status=atv_data['status'],
-                purchase_price=atv_data['purchase_price'],
-                purchase_location=atv_data['purchase_location'],
-                description=atv_data['description'],
-                total_earnings=atv_data.get('total_earnings', 0),
-                # Add hours tracking fields with defaults if not present in backup
-                acquisition_hours=atv_data.get('acquisition_hours', 0),
-                repair_hours=atv_data.get('repair_hours', 0),
-                selling_hours=atv_data.get('selling_hours', 0),
-                total_hours=atv_data.get('total_hours', 0)
-            )
-            if atv_data['purchase_date']:
-                atv.purchase_date = atv_data['purchase_date']
-            if atv_data.get('created_at'):
-                try:
-                    if isinstance(atv_data['created_at'], str):
-                        atv.created_at = datetime.strptime(atv_data['created_at'].split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    else:
-                        atv.created_at = atv_data['created_at']
-                except:
-                    atv.created_at = datetime.now()
-            if atv_data.get('updated_at'):
-                try:
-                    if isinstance(atv_data['updated_at'], str):
-                        atv.updated_at = datetime.strptime(atv_data['updated_at'].split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    else:
-                        atv.updated_at = atv_data['updated_at']
-                except:
-                    atv.updated_at = datetime.now()
-            db.session.add(atv)
-        db.session.commit()
-        print(f"Imported {len(data['atvs'])} ATVs")
-        
-        # Import Parts
-        for part_data in data['parts']:
-            part = Part(
-                id=part_data['id'],
-                name=part_data['name'],
-                part_number=part_data['part_number'],
-                condition=part_data['condition'],
-                location=part_data['location'],
-                storage_id=part_data['storage_id'],
-                status=part_data['status'],
-                source_price=part_data['source_price'],
-                list_price=part_data['list_price'],
-                sold_price=part_data['sold_price'],
-                shipping_cost=part_data['shipping_cost'],
-                platform_fees=part_data['platform_fees'],
-                platform=part_data['platform'],
-                listing_url=part_data['listing_url'],
-                atv_id=part_data['atv_id'],
-                description=part_data['description']
-            )
-            if part_data['sold_date']:
-                part.sold_date = datetime.fromisoformat(part_data['sold_date'])
-            if part_data.get('created_at'):
-                try:
-                    if isinstance(part_data['created_at'], str):
-                        part.created_at = datetime.strptime(part_data['created_at'].split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    else:
-                        part.created_at = part_data['created_at']
-                except:
-                    part.created_at = datetime.now()
-            if part_data.get('updated_at'):
-                try:
-                    if isinstance(part_data['updated_at'], str):
-                        part.updated_at = datetime.strptime(part_data['updated_at'].split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    else:
-                        part.updated_at = part_data['updated_at']
-                except:
-                    part.updated_at = datetime.now()
-            db.session.add(part)
-        db.session.commit()
-        print(f"Imported {len(data['parts'])} parts")
+            db.session.query(BackupTombstone).delete()
+            print("All existing data deleted")
         
-        # Import Images
-        for image_data in data['images']:
-            image = Image(
-                id=image_data['id'],
-                filename=image_data['filename'],
-                atv_id=image_data['atv_id'],
-                part_id=image_data['part_id'],
-                description=image_data['description'],
-                image_type=image_data.get('image_type', 'general')  
-            )
-            if image_data['created_at']:
-                try:
-                    if isinstance(image_data['created_at'], str):
-                        image.created_at = datetime.strptime(image_data['created_at'].split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    else:
-                        image.created_at = image_data['created_at']
-                except:
-                    image.created_at = datetime.now()
-            db.session.add(image)
-        db.session.commit()
-        print(f"Imported {len(data['images'])} images")
+        for position, path in enumerate(chain):
+            upsert = position > 0
+            print(f"Restoring {os.path.basename(path)}")
+            for name, rows in iter_backup_sections(path):
+                if name == 'tombstones':
+                    print(f"Applied {_apply_tombstones(rows)} deletes")
+                    continue
+                if name not in models:
+                    continue
+                started = time.perf_counter()
+                count = _restore_table(models[name].__table__, rows, upsert=upsert)
+                elapsed = time.perf_counter() - started
+                rate = count / elapsed if elapsed > 0 else 0
+                total, total_elapsed = stats.get(name, (0, 0))
+                stats[name] = (total + count, total_elapsed + elapsed)
+                print(f"Imported {count} {name} ({rate:,.0f} rows/sec)")
         
-        # Import Expenses
-        for expense_data in data['expenses']:
-            expense = Expense(
-                id=expense_data['id'],
-                amount=expense_data['amount'],
-                category=expense_data['category'],
-                description=expense_data['description'],
-                atv_id=expense_data['atv_id']
-            )
-            if expense_data['date']:
-                expense.date = datetime.fromisoformat(expense_data['date'])
-            if expense_data.get('created_at'):
-                try:
-                    if isinstance(expense_data['created_at'], str):
-                        expense.created_at = datetime.strptime(expense_data['created_at'].split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    else:
-                        expense.created_at = expense_data['created_at']
-                except:
-                    expense.created_at = datetime.now()
-            db.session.add(expense)
+        reset_sequences(model.__table__ for _, model in BACKUP_TABLES)
         db.session.commit()
-        print(f"Imported {len(data['expenses'])} expenses")
         
-        # Import Sales
-        for sale_data in data['sales']:
-            sale = Sale(
-                id=sale_data['id'],
-                amount=sale_data['amount'],
-                platform=sale_data['platform'],
-                fees=sale_data['fees'],
-                shipping_cost=sale_data['shipping_cost'],
-                net_amount=sale_data['net_amount'],
-                type=sale_data['type'],
-                atv_id=sale_data['atv_id'],
-                description=sale_data['description']
-            )
-            if sale_data['date']:
-                sale.date = datetime.fromisoformat(sale_data['date'])
-            if sale_data.get('created_at'):
-                try:
-                    if isinstance(sale_data['created_at'], str):
-                        sale.created_at = datetime.strptime(sale_data['created_at'].split('.')[0], '%Y-%m-%d %H:%M:%S')
-                    else:
-                        sale.created_at = sale_data['created_at']
-                except:
-                    sale.created_at = datetime.now()
-            db.session.add(sale)
-        db.session.commit()
-        print(f"Imported {len(data['sales'])} sales")
+        # Bulk inserts bypass the flush hooks, so rebuild the rollups
+        rebuild_atv_rollups()
+        print("Rebuilt ATV financial rollups")
     except Exception as e:
         db.session.rollback()
         print(f"Error importing data: {str(e)}")
         raise
+    
+    _mark_restored()
+    return {name: (count, count / elapsed if elapsed > 0 else 0) for name, (count, elapsed) in stats.items()}
+
+def sqlite_database_path():
+    """File path of the app database if it is a file-backed SQLite database, else None"""
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return url.database
+
+def create_snapshot(snapshot_path=None):
+    """Copy the SQLite database to a snapshot file with the online backup API.
+
+    The copy is consistent even while the app keeps serving requests, and
+    is written under a temporary name and moved into place once complete.
+    Only available when the app runs on SQLite.
+    """
+    if sqlite_database_path() is None:
+        raise ValueError('Snapshots are only available for SQLite databases')
+    
+    if snapshot_path is None:
+        os.makedirs(backup_dir(), exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        snapshot_path = os.path.join(backup_dir(), f'snapshot_{timestamp}{SNAPSHOT_EXTENSION}')
+    
+    temp_path = snapshot_path + '.partial'
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            with db.engine.connect() as connection:
+                connection.connection.dbapi_connection.backup(target)
+            # The copy inherits WAL mode; switch it back so the snapshot is one self-contained file
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+        os.replace(temp_path, snapshot_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    return snapshot_path
+
+def restore_snapshot(snapshot_path):
+    """Replace the SQLite database contents with a snapshot.
+
+    The snapshot is integrity-checked first, then copied page by page into
+    the live database through the backup API, so open connections see the
+    restored data rather than a file swapped out from under them.
+    """
+    if sqlite_database_path() is None:
+        raise ValueError('Snapshots are only available for SQLite databases')
+    
+    with open(snapshot_path, 'rb') as f:
+        if f.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+            raise ValueError('Not a SQLite snapshot file')
+    
+    # as_uri() percent-encodes characters like '?', '#' and '%' that would end the path
+    source = sqlite3.connect(Path(snapshot_path).resolve().as_uri() + '?mode=ro', uri=True)
+    try:
+        if source.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+            raise ValueError('Snapshot failed its integrity check')
+        
+        db.session.remove()
+        with db.engine.connect() as connection:
+            source.backup(connection.connection.dbapi_connection)
+    finally:
+        source.close()
+    
+    # Pooled connections may have cached the old schema
+    db.engine.dispose()
+    _mark_restored()
+    return snapshot_path
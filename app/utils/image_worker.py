@@ -0,0 +1,119 @@
+"""Background processing for uploaded images.
+
+Upload handlers put the original in the image store, flush the Image row
+with processing_status='pending' and call queue_image_processing(). Once the
+request's transaction commits, the queued ids are handed to a small thread
+pool that writes the resized variants and marks the row ready (or failed).
+Until then pages fall back to the original file.
+
+The pool lives in the web process, so jobs queued when a worker exits or is
+recycled are lost. `flask amf process-images` (run after deploys, or from
+cron) picks up rows left pending or failed and processes them.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Image
+from app.utils.images import image_directory, generate_variants, store_upload, has_variants
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor(workers):
+    """The process's worker pool, created on first use (and again after a fork)"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-worker')
+            _executor_pid = os.getpid()
+        return _executor
+
+def process_image(image_id):
+    """Generate an image's variants, then record the result"""
+    image = db.session.get(Image, image_id)
+    if image is None:
+        return
+    path = os.path.join(image_directory(image), image.filename)
+    image.processing_status = 'ready' if generate_variants(path) else 'failed'
+    db.session.commit()
+
+def stale_image_ids(older_than=timedelta(minutes=10)):
+    """Ids of images left pending or failed for longer than `older_than`.
+
+    The age check keeps freshly queued uploads, which a worker may still be
+    processing, out of the list.
+    """
+    cutoff = datetime.utcnow() - older_than
+    query = (db.session.query(Image.id)
+             .filter(Image.processing_status.in_(('pending', 'failed')),
+                     db.or_(Image.updated_at.is_(None), Image.updated_at < cutoff))
+             .order_by(Image.id))
+    return [image_id for image_id, in query]
+
+def _run_job(app, image_id):
+    with app.app_context():
+        try:
+            process_image(image_id)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Image job {image_id} failed: {str(e)}")
+
+def process_stale_images(app, older_than=timedelta(minutes=10)):
+    """Process the stale_image_ids() inline. Returns (processed, still failed)."""
+    image_ids = stale_image_ids(older_than)
+    for image_id in image_ids:
+        _run_job(app, image_id)
+    if not image_ids:
+        return 0, 0
+    failed = (db.session.query(Image.id)
+              .filter(Image.id.in_(image_ids), Image.processing_status != 'ready')
+              .count())
+    return len(image_ids), failed
+
+def add_uploaded_image(file, extension, **attributes):
+    """Put an upload in the image store and add its Image row to the session.
+
+    If the store already has this content with its variants the row is ready
+    straight away; otherwise the variants are queued for after commit.
+    """
+    content_hash, filename = store_upload(file, extension)
+    image = Image(filename=filename, content_hash=content_hash, **attributes)
+    if has_variants(image):
+        image.processing_status = 'ready'
+        db.session.add(image)
+    else:
+        image.processing_status = 'pending'
+        db.session.add(image)
+        db.session.flush()
+        queue_image_processing(image.id)
+    return image
+
+def queue_image_processing(image_id):
+    """Process an image once the current transaction commits"""
+    db.session.info.setdefault('image_jobs', []).append(image_id)
+
+@event.listens_for(Session, 'after_commit')
+def _submit_image_jobs(session):
+    image_ids = session.info.pop('image_jobs', None)
+    if not image_ids:
+        return
+    app = current_app._get_current_object()
+    workers = app.config.get('IMAGE_WORKERS', 0)
+    if workers <= 0:
+        # Inline mode; _run_job's own app context gives it a separate session
+        for image_id in image_ids:
+            _run_job(app, image_id)
+        return
+    executor = _get_executor(workers)
+    for image_id in image_ids:
+        executor.submit(_run_job, app, image_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_image_jobs(session):
+    session.info.pop('image_jobs', None)
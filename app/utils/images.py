@@ -0,0 +1,348 @@
+"""Image file helpers: where uploads live on disk and the resized variants served to pages.
+
+Uploads go into a content-addressed store under UPLOAD_FOLDER/store, named
+by the SHA-256 of the file and sharded two levels deep by its first four hex
+digits (store/ab/cd/abcd...ef.jpg). The same photo uploaded to several parts
+is kept once; its files are removed when the last Image row referencing the
+hash is deleted (unless an upload has just reused it; see
+_release_stored_files), and `flask amf gc-images` sweeps up any files that
+were kept for an upload which never committed. Images from before the store keep their old locations until
+scripts/migrate_images_to_store.py moves them in.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from flask import current_app, request, url_for
+from werkzeug.utils import send_file
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+from app import db
+from app.models import Image
+
+# Longest edge in pixels for each generated variant
+IMAGE_SIZES = {
+    'thumb': 400,
+    'medium': 1200,
+    'full': 2560,
+}
+VARIANT_QUALITY = 85
+
+STORE_DIRECTORY = 'store'
+HASH_CHUNK_SIZE = 1024 * 1024
+# A stored original touched this recently may belong to an upload that hasn't committed yet
+STORE_RELEASE_GRACE = 5 * 60
+
+# Store files never change under their name, so browsers may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# <hash>.<ext> for an original, <hash>_<size>_<edge>q<quality>.jpg for a variant
+MEDIA_NAME = re.compile(r'^([0-9a-f]{64})(?:_(?:%s)_\d+q\d+)?\.[a-z0-9]+$' % '|'.join(IMAGE_SIZES))
+
+def store_directory(content_hash):
+    """Shard directory for a content hash: store/<hex 0-2>/<hex 2-4>"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], STORE_DIRECTORY,
+                        content_hash[:2], content_hash[2:4])
+
+def store_staging_directory():
+    """Scratch directory inside the store, on the same filesystem so files can be renamed in and out"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], STORE_DIRECTORY, 'tmp')
+
+def store_filename(content_hash, extension):
+    """Name of a stored original: the hash plus the upload's extension"""
+    return f"{content_hash}.{extension}" if extension else content_hash
+
+def is_stored(image):
+    """True if the image's file lives in the content-addressed store"""
+    return bool(image.content_hash) and image.filename.startswith(image.content_hash)
+
+def legacy_image_directory(image):
+    """Where images uploaded before the store were written.
+
+    ATV images are under atv/<atv id>/; part images are directly in the
+    upload folder.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    if image.atv_id and not image.part_id:
+        return os.path.join(upload_folder, 'atv', str(image.atv_id))
+    return upload_folder
+
+def image_directory(image):
+    """Directory holding an image's original file and its variants"""
+    if is_stored(image):
+        return store_directory(image.content_hash)
+    return legacy_image_directory(image)
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def store_upload(file, extension):
+    """Write an uploaded file into the store, hashing it as it is written.
+
+    Returns (content_hash, filename). If the store already holds the same
+    content the new copy is discarded, and the existing file's mtime is
+    bumped so a concurrent release of the hash leaves it in place.
+    """
+    staging = store_staging_directory()
+    os.makedirs(staging, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=staging)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        content_hash = digest.hexdigest()
+        filename = store_filename(content_hash, extension)
+        directory = store_directory(content_hash)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            os.replace(temp_path, path)
+        else:
+            os.remove(temp_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return content_hash, filename
+
+def has_variants(image):
+    """True if every resized variant of the image is already on disk"""
+    directory = image_directory(image)
+    return all(os.path.exists(os.path.join(directory, variant_filename(image.filename, size)))
+               for size in IMAGE_SIZES)
+
+def variant_filename(filename, size):
+    """Filename of a resized variant, stored next to the original.
+
+    The name carries the edge length and JPEG quality it was made with, so
+    changing IMAGE_SIZES or VARIANT_QUALITY gives new files under new (still
+    immutable) URLs rather than new bytes under the old ones.
+    """
+    stem = filename.rsplit('.', 1)[0]
+    return f"{stem}_{size}_{IMAGE_SIZES[size]}q{VARIANT_QUALITY}.jpg"
+
+def variant_files(directory, filename):
+    """Names of every variant of `filename` in `directory`, whatever settings made them"""
+    stem = re.escape(filename.rsplit('.', 1)[0])
+    pattern = re.compile(r'^%s_(?:%s)(?:_\d+q\d+)?\.jpg$' % (stem, '|'.join(IMAGE_SIZES)))
+    try:
+        return [name for name in os.listdir(directory) if pattern.match(name)]
+    except OSError:
+        return []
+
+def stored_original_name(content_hash):
+    """Filename of the stored original for a hash, or None if it isn't in the store"""
+    try:
+        names = os.listdir(store_directory(content_hash))
+    except OSError:
+        return None
+    for name in names:
+        if name == content_hash or name.startswith(content_hash + '.'):
+            return name
+    return None
+
+def generate_variants(path):
+    """Write a JPEG variant of the image at `path` for each size in IMAGE_SIZES.
+
+    EXIF orientation is applied to the pixels and no metadata is copied to
+    the variants. The original file is left untouched. Returns the list of
+    sizes written (empty if the file isn't an image Pillow can read).
+    """
+    try:
+        with PILImage.open(path) as original:
+            picture = ImageOps.exif_transpose(original)
+            if picture.mode in ('RGBA', 'LA', 'P'):
+                picture = picture.convert('RGBA')
+                background = PILImage.new('RGB', picture.size, (255, 255, 255))
+                background.paste(picture, mask=picture.getchannel('A'))
+                picture = background
+            elif picture.mode != 'RGB':
+                picture = picture.convert('RGB')
+
+            directory, filename = os.path.split(path)
+            written = []
+            # Largest first so each smaller size is resampled from a smaller image
+            for size, edge in sorted(IMAGE_SIZES.items(), key=lambda item: -item[1]):
+                picture.thumbnail((edge, edge), PILImage.LANCZOS)
+                # Write then rename: a deduplicated upload may be processed twice at once
+                fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.partial')
+                with os.fdopen(fd, 'wb') as out:
+                    picture.save(out, 'JPEG', quality=VARIANT_QUALITY, optimize=True, progressive=True)
+                os.replace(temp_path, os.path.join(directory, variant_filename(filename, size)))
+                written.append(size)
+            return written
+    except (UnidentifiedImageError, OSError) as e:
+        current_app.logger.warning(f"Could not generate variants for {path}: {str(e)}")
+        return []
+
+def image_file_path(image, size=None):
+    """Path of the file to serve for an image: the requested variant once it exists, else the original"""
+    directory = image_directory(image)
+    if size in IMAGE_SIZES and not image.variants_pending:
+        path = os.path.join(directory, variant_filename(image.filename, size))
+        # Stored images skip the stat: /media/ falls back to the original for a missing variant
+        if (image.processing_status == 'ready' and is_stored(image)) or os.path.exists(path):
+            return path
+    return os.path.join(directory, image.filename)
+
+def media_file_path(name):
+    """Path in the store for a /media/ filename, or None if the name isn't one"""
+    match = MEDIA_NAME.match(name)
+    if not match:
+        return None
+    return os.path.join(store_directory(match.group(1)), name)
+
+def send_image(path, etag=None, immutable=False):
+    """Response sending an image file.
+
+    Handles If-None-Match (304) and Range requests. With IMAGE_SENDFILE set
+    to 'x-accel' (nginx) or 'x-sendfile' (Apache, lighttpd) only headers are
+    returned and the web server sends the bytes, and any ranges, itself.
+    """
+    mode = current_app.config.get('IMAGE_SENDFILE')
+    environ = request.environ
+    if mode:
+        # Ranges are left to the web server
+        environ = {key: value for key, value in environ.items()
+                   if key not in ('HTTP_RANGE', 'HTTP_IF_RANGE')}
+    response = send_file(
+        path, environ,
+        etag=etag or True,
+        max_age=IMMUTABLE_MAX_AGE if immutable else None,
+        use_x_sendfile=bool(mode),
+        response_class=current_app.response_class
+    )
+    if immutable:
+        response.cache_control.immutable = True
+    if mode == 'x-accel' and 'X-Sendfile' in response.headers:
+        del response.headers['X-Sendfile']
+        relative = os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = current_app.config['IMAGE_ACCEL_PREFIX'].rstrip('/') + '/' + relative
+    return response
+
+def remove_image_files(image):
+    """Delete an image's original file and all of its variants.
+
+    Stored images are shared by content, so their files are only removed
+    once the deletion commits and no other Image row references the hash
+    (see _release_stored_files below).
+    """
+    if is_stored(image):
+        return
+    directory = legacy_image_directory(image)
+    for filename in [image.filename] + variant_files(directory, image.filename):
+        try:
+            os.remove(os.path.join(directory, filename))
+        except OSError:
+            pass  # File might not exist
+
+def image_url(image, size='medium'):
+    """URL of the variant of an image that fits the page (template global).
+
+    Stored images get a /media/ URL named by their content hash, which is
+    cached as immutable; a variant that isn't ready yet gets the original's.
+    """
+    if is_stored(image):
+        return url_for('atv.media', name=os.path.basename(image_file_path(image, size)))
+    if image.atv_id and not image.part_id:
+        return url_for('atv.view_image', id=image.id, size=size)
+    # Part images are served straight from static/uploads
+    path = os.path.relpath(image_file_path(image, size), current_app.config['UPLOAD_FOLDER'])
+    return url_for('static', filename='uploads/' + path.replace(os.sep, '/'))
+
+@event.listens_for(Session, 'after_flush')
+def _collect_released_hashes(session, flush_context):
+    released = {obj.content_hash for obj in session.deleted
+                if isinstance(obj, Image) and is_stored(obj)}
+    if released:
+        session.info.setdefault('released_hashes', set()).update(released)
+
+def _release_hash(content_hash):
+    """Remove a hash's files from the store, unless an upload is reusing them.
+
+    store_upload() keeps an existing original by bumping its mtime, and
+    places its own copy if the original has gone. So the files are first
+    moved aside: an original touched within STORE_RELEASE_GRACE, or one
+    that has reappeared at its old path, means an upload of the same
+    content is in flight and everything is put back. Returns True if the
+    files were removed.
+    """
+    directory = store_directory(content_hash)
+    try:
+        names = [name for name in os.listdir(directory) if name.startswith(content_hash)]
+    except OSError:
+        return False
+    # Originals first, so an upload arriving midway re-places the original before its has_variants() check
+    names.sort(key=lambda name: name[len(content_hash):].startswith('_'))
+    staging = store_staging_directory()
+    os.makedirs(staging, exist_ok=True)
+    holding = tempfile.mkdtemp(dir=staging, prefix='released-')
+    moved = []
+    for name in names:
+        try:
+            os.rename(os.path.join(directory, name), os.path.join(holding, name))
+        except OSError:
+            continue
+        moved.append(name)
+    originals = [name for name in moved if not name[len(content_hash):].startswith('_')]
+    now = time.time()
+    in_use = any(now - os.stat(os.path.join(holding, name)).st_mtime < STORE_RELEASE_GRACE
+                 or os.path.exists(os.path.join(directory, name))
+                 for name in originals)
+    if in_use:
+        for name in moved:
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                os.replace(os.path.join(holding, name), path)
+    shutil.rmtree(holding, ignore_errors=True)
+    return not in_use
+
+def remove_unreferenced_store_files():
+    """Delete store files whose hash no Image row references (`flask amf gc-images`).
+
+    A release that finds its files touched within STORE_RELEASE_GRACE keeps
+    them, and if the upload that touched them never commits nothing else
+    removes them. Files still inside the grace period are left for the next
+    run. Returns the number of hashes removed.
+    """
+    root = os.path.join(current_app.config['UPLOAD_FOLDER'], STORE_DIRECTORY)
+    staging = store_staging_directory()
+    stored = set()
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories[:] = [name for name in subdirectories if os.path.join(directory, name) != staging]
+        stored.update(name[:64] for name in names if re.match(r'[0-9a-f]{64}', name))
+    if not stored:
+        return 0
+    referenced = set(db.session.scalars(
+        select(Image.content_hash).where(Image.content_hash.isnot(None)).distinct()
+    ))
+    return sum(_release_hash(content_hash) for content_hash in sorted(stored - referenced))
+
+@event.listens_for(Session, 'after_commit')
+def _release_stored_files(session):
+    """Reference counting for the store: drop files no Image row points at any more"""
+    released = session.info.pop('released_hashes', None)
+    if not released:
+        return
+    # The session can't run SQL in after_commit, so check on a fresh connection
+    with db.engine.connect() as connection:
+        referenced = set(connection.scalars(
+            select(Image.content_hash).where(Image.content_hash.in_(released)).distinct()
+        ))
+    for content_hash in released - referenced:
+        _release_hash(content_hash)
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_released_hashes(session):
+    session.info.pop('released_hashes', None)
@@ -0,0 +1,110 @@
+"""Keyset (cursor) pagination helpers for the list views"""
+import base64
+import binascii
+import json
+from datetime import datetime, date
+from sqlalchemy import and_, or_
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+def encode_cursor(sort_key, values):
+    """Pack the sort key values of a row into an opaque URL-safe token"""
+    payload = json.dumps({'s': sort_key, 'v': [_encode_value(v) for v in values]},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, sort_key, size):
+    """Unpack a cursor token, returning None if it is malformed or for another sort"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_decode_value(v) for v in payload['v']]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None
+    if payload.get('s') != sort_key or len(values) != size:
+        return None
+    return values
+
+def _seek_condition(order, values):
+    """Rows strictly after `values` in the given (expression, descending) order"""
+    clauses = []
+    for i, (expr, descending) in enumerate(order):
+        prefix = [order[j][0] == values[j] for j in range(i)]
+        step = expr < values[i] if descending else expr > values[i]
+        clauses.append(and_(*prefix, step))
+    return or_(*clauses)
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move forward/back"""
+
+    def __init__(self, items, next_cursor, prev_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def keyset_paginate(query, order, sort_key, after=None, before=None, per_page=None):
+    """Return a KeysetPage for `query` ordered by `order`.
+
+    `order` is a list of (expression, descending) pairs and must end with a
+    unique column (usually the primary key) so every row has a distinct
+    position. The query must not already be ordered. `after`/`before` are
+    cursor tokens from a previous page; an invalid token starts from the top.
+    """
+    per_page = max(1, min(per_page or DEFAULT_PER_PAGE, MAX_PER_PAGE))
+    expressions = [expr for expr, _ in order]
+
+    values = decode_cursor(before, sort_key, len(order)) if before else None
+    backwards = values is not None
+    if not backwards:
+        values = decode_cursor(after, sort_key, len(order)) if after else None
+
+    # Walking backwards means seeking in the reversed order, then flipping the rows
+    effective_order = [(expr, not desc) for expr, desc in order] if backwards else order
+
+    query = query.add_columns(*expressions)
+    if values is not None:
+        query = query.filter(_seek_condition(effective_order, values))
+    query = query.order_by(*[expr.desc() if desc else expr.asc() for expr, desc in effective_order])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if backwards:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, values is not None
+
+    items = [row[0] for row in rows]
+    next_cursor = encode_cursor(sort_key, rows[-1][1:]) if rows and has_next else None
+    prev_cursor = encode_cursor(sort_key, rows[0][1:]) if rows and has_prev else None
+    return KeysetPage(items, next_cursor, prev_cursor, per_page)
@@ -0,0 +1,217 @@
+"""Per-request database instrumentation.
+
+Cursor-execute hooks on every engine count the queries a request issues,
+add up their time and remember the slowest. Each response gets a
+Server-Timing header (visible in the browser's network panel), requests
+slower than PERF_SLOW_REQUEST_MS are logged, and every request's timings go
+into a small per-endpoint ring buffer that /admin/perf summarises as
+p50/p95. The buffer is in memory, so each worker process keeps its own.
+Queries run while a streamed response is being sent (CSV exports) happen
+after the request is recorded and aren't counted.
+
+With QUERY_CHECKS set to 'warn' (development) or 'raise' (tests), requests
+are also checked for N+1 patterns: each statement is reduced to its shape
+(literals and IN lists replaced by ?), and a shape that runs more than
+N_PLUS_ONE_THRESHOLD times in one request is reported with the template
+line and code that issued it. Endpoints listed in QUERY_BUDGET_FILE are
+checked against their query budget the same way.
+"""
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_samples = {}
+_samples_lock = threading.Lock()
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\([^()]*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+class NPlusOneError(Exception):
+    """The same statement shape ran more than N_PLUS_ONE_THRESHOLD times in one request"""
+
+class QueryBudgetExceeded(Exception):
+    """A request issued more queries than its endpoint's budget"""
+
+def normalize_sql(statement):
+    """The shape of a statement: literals and IN lists replaced by ?, whitespace collapsed"""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('IN (?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+def query_origin():
+    """Where the running query came from: the template line and the innermost app code"""
+    template = code = None
+    frame = sys._getframe(1)
+    while frame is not None and not (template and code):
+        jinja_template = frame.f_globals.get('__jinja_template__')
+        if jinja_template is not None:
+            if template is None:
+                template = f"{jinja_template.name}:{jinja_template.get_corresponding_lineno(frame.f_lineno)}"
+        elif code is None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(APP_ROOT) and filename != __file__:
+                relative = os.path.relpath(filename, os.path.dirname(APP_ROOT))
+                code = f"{relative}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ' via '.join(part for part in (template, code) if part) or 'unknown'
+
+_budgets = {}
+
+def query_budgets(path):
+    """Per-endpoint query budgets from a JSON file ({"atv.view_atv": 7, ...}), cached per path"""
+    if path not in _budgets:
+        try:
+            with open(path) as f:
+                _budgets[path] = json.load(f)
+        except (OSError, ValueError):
+            _budgets[path] = {}
+    return _budgets[path]
+
+def check_query_budget(endpoint, query_count, path=None):
+    """The endpoint's budget if query_count is over it, else None"""
+    budget = query_budgets(path or current_app.config['QUERY_BUDGET_FILE']).get(endpoint)
+    if budget is not None and query_count > budget:
+        return budget
+    return None
+
+class RequestStats:
+    """Database work done while handling one request"""
+
+    def __init__(self, n_plus_one_threshold=None):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.shape_counts = {}
+        # shape -> where it was issued, once it passed the threshold
+        self.repeated = {}
+
+    def record(self, statement, elapsed):
+        self.query_count += 1
+        self.db_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+
+    def count_shape(self, statement):
+        """Count the statement's shape; returns True the first time it goes over the threshold"""
+        shape = normalize_sql(statement)
+        count = self.shape_counts[shape] = self.shape_counts.get(shape, 0) + 1
+        if count == self.n_plus_one_threshold + 1:
+            self.repeated[shape] = query_origin()
+            return True
+        return False
+
+    def n_plus_one_report(self):
+        return '; '.join(f"{self.shape_counts[shape]}x [{origin}] {shape[:200]}"
+                         for shape, origin in self.repeated.items())
+
+def current_stats():
+    """The RequestStats for the request being handled, or None outside one"""
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+# The start time lives on the execution context, which is dropped with the
+# statement, so one that raises doesn't leave anything behind on the connection
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    stats = current_stats()
+    if stats is None or started is None:
+        return
+    stats.record(statement, time.perf_counter() - started)
+    if stats.n_plus_one_threshold and stats.count_shape(statement):
+        if current_app.config.get('QUERY_CHECKS') == 'raise':
+            raise NPlusOneError(f"Possible N+1 in {request.endpoint}: {stats.n_plus_one_report()}")
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def endpoint_summary():
+    """p50/p95 request and DB time and query counts per endpoint, slowest p95 first"""
+    with _samples_lock:
+        snapshot = {endpoint: list(samples) for endpoint, samples in _samples.items()}
+    rows = []
+    for endpoint, samples in snapshot.items():
+        totals = [sample[0] for sample in samples]
+        db_times = [sample[1] for sample in samples]
+        queries = [sample[2] for sample in samples]
+        rows.append({
+            'endpoint': endpoint,
+            'samples': len(samples),
+            'p50_ms': percentile(totals, 0.5),
+            'p95_ms': percentile(totals, 0.95),
+            'db_p50_ms': percentile(db_times, 0.5),
+            'db_p95_ms': percentile(db_times, 0.95),
+            'queries_p50': percentile(queries, 0.5),
+            'queries_max': max(queries),
+        })
+    rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return rows
+
+def init_perf(app):
+    @app.before_request
+    def _start_request_stats():
+        checks = app.config.get('QUERY_CHECKS')
+        g._request_stats = RequestStats(app.config['N_PLUS_ONE_THRESHOLD'] if checks else None)
+
+    @app.after_request
+    def _finish_request_stats(response):
+        stats = g.pop('_request_stats', None)
+        if stats is None or request.endpoint in (None, 'static'):
+            return response
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        db_ms = stats.db_time * 1000
+
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats.query_count} queries"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms - db_ms:.1f}')
+
+        with _samples_lock:
+            samples = _samples.get(request.endpoint)
+            if samples is None:
+                samples = _samples[request.endpoint] = deque(maxlen=app.config['PERF_SAMPLES_PER_ENDPOINT'])
+            samples.append((total_ms, db_ms, stats.query_count))
+
+        if total_ms >= app.config['PERF_SLOW_REQUEST_MS']:
+            slowest = ' '.join((stats.slowest_statement or '').split())[:300]
+            app.logger.warning(
+                f"Slow request {request.method} {request.path} ({request.endpoint}): "
+                f"{total_ms:.0f}ms, {stats.query_count} queries, {db_ms:.0f}ms in the database; "
+                f"slowest query {stats.slowest_time * 1000:.0f}ms: {slowest}"
+            )
+
+        checks = app.config.get('QUERY_CHECKS')
+        if checks:
+            if stats.repeated:
+                app.logger.warning(f"Possible N+1 in {request.endpoint}: {stats.n_plus_one_report()}")
+            budget = check_query_budget(request.endpoint, stats.query_count, app.config['QUERY_BUDGET_FILE'])
+            if budget is not None:
+                message = f"{request.endpoint} ran {stats.query_count} queries; its budget is {budget}"
+                if checks == 'raise':
+                    raise QueryBudgetExceeded(message)
+                app.logger.warning(message)
+        return response
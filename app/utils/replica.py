@@ -0,0 +1,44 @@
+"""Routing read-only report and export queries to the analytics database.
+
+When SQLALCHEMY_BINDS has an 'analytics' entry (ANALYTICS_DATABASE_URL: a
+read replica, or for local testing a copy of the SQLite file), SELECTs run
+inside `with analytics_reads():` or a view decorated with
+@uses_analytics_db go to it. Everything else — writes, flushes, raw text()
+statements — stays on the primary. Without the bind, both are no-ops and
+the primary serves everything.
+"""
+from contextlib import contextmanager
+from functools import wraps
+from flask_sqlalchemy.session import Session
+
+ANALYTICS_BIND = 'analytics'
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends SELECTs to the analytics engine while routing is on"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(ANALYTICS_BIND) and getattr(clause, 'is_select', False):
+            engine = self._db.engines.get(ANALYTICS_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@contextmanager
+def analytics_reads():
+    """Run the session's SELECTs on the analytics database for the duration of the block"""
+    from app import db
+    info = db.session.info
+    previous = info.get(ANALYTICS_BIND, False)
+    info[ANALYTICS_BIND] = True
+    try:
+        yield
+    finally:
+        info[ANALYTICS_BIND] = previous
+
+def uses_analytics_db(view):
+    """View decorator: the view's queries read from the analytics database"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with analytics_reads():
+            return view(*args, **kwargs)
+    return wrapper
@@ -1,15 +1,93 @@
 import os
+import tempfile
 from datetime import timedelta
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+def engine_options(database_uri, pool_size=5, max_overflow=10):
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URI.
+
+    Server databases get a sized pool with pre-ping and recycling, and
+    PostgreSQL a statement timeout; all tunable through DB_* env vars.
+    SQLite needs none of that (see SQLITE_PRAGMAS instead).
+    """
+    if not database_uri or database_uri.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': _env_int('DB_POOL_SIZE', pool_size),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', max_overflow),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+    statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 30000)
+    if database_uri.startswith('postgres') and statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+def analytics_binds():
+    """SQLALCHEMY_BINDS with the 'analytics' read replica, if ANALYTICS_DATABASE_URL is set"""
+    url = os.environ.get('ANALYTICS_DATABASE_URL')
+    if not url:
+        return {}
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    # connect_args is reset so the primary's (e.g. a Postgres statement_timeout) doesn't leak into a SQLite copy
+    return {'analytics': {'url': url, 'connect_args': {}, **engine_options(url)}}
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-please-change'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # Reports and exports read from here when set; see app/utils/replica.py
+    SQLALCHEMY_BINDS = analytics_binds()
+    # Set on every new SQLite connection: WAL lets readers run alongside a writer,
+    # and busy_timeout makes a second writer wait instead of failing "database is locked"
+    SQLITE_PRAGMAS = {
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': -_env_int('SQLITE_CACHE_KB', 64000),  # negative = KiB rather than pages
+        'mmap_size': _env_int('SQLITE_MMAP_BYTES', 256 * 1024 * 1024),
+    }
     UPLOAD_FOLDER = os.path.join(basedir, 'app', 'static', 'uploads')
+    # Hashed, compressed copies of app/static written by scripts/build_static.py
+    STATIC_BUILD_FOLDER = os.path.join(basedir, 'app', 'static_build')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    # Background threads per process for image resizing/hashing (0 = process inline)
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    # Let the web server send image bytes: 'x-accel' for nginx, 'x-sendfile' for
+    # Apache/lighttpd; unset serves them from Python. For nginx, map the prefix to
+    # UPLOAD_FOLDER in an internal location, e.g.
+    #   location /_uploads/ { internal; alias /app/app/static/uploads/; }
+    IMAGE_SENDFILE = os.environ.get('IMAGE_SENDFILE', '').lower()
+    IMAGE_ACCEL_PREFIX = os.environ.get('IMAGE_ACCEL_PREFIX', '/_uploads/')
+    # gzip/brotli for text responses; smaller bodies aren't worth the CPU
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_QUALITY = 4
+    # Requests slower than this are logged with their query count and slowest query
+    PERF_SLOW_REQUEST_MS = _env_int('PERF_SLOW_REQUEST_MS', 500)
+    # Recent requests kept per endpoint for the /admin/perf percentiles
+    PERF_SAMPLES_PER_ENDPOINT = 500
+    # N+1 and query budget checks: None (off), 'warn' (log) or 'raise' (for tests)
+    QUERY_CHECKS = os.environ.get('QUERY_CHECKS') or None
+    # A statement shape running more often than this in one request is reported
+    N_PLUS_ONE_THRESHOLD = 5
+    # {"endpoint": max queries per request}
+    QUERY_BUDGET_FILE = os.path.join(basedir, 'query_budgets.json')
     
     # Common settings for all configurations
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
@@ -20,6 +98,7 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    QUERY_CHECKS = os.environ.get('QUERY_CHECKS', 'warn')
     
     @classmethod
     def init_app(cls, app):
@@ -42,6 +121,7 @@ class ProductionConfig(Config):
     if SQLALCHEMY_DATABASE_URI and SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
         # Heroku workaround for SQLAlchemy 1.4+
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace('postgres://', 'postgresql://', 1)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, pool_size=10, max_overflow=20)
     
     @classmethod
     def init_app(cls, app):
@@ -55,9 +135,22 @@ class ProductionConfig(Config):
             app.logger.addHandler(stream_handler)
             app.logger.setLevel(logging.INFO)
 
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    # In-memory SQLite unless TEST_DATABASE_URL points somewhere else
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = {}
+    UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'amf-test-uploads')
+    IMAGE_WORKERS = 0
+    # N+1 patterns and blown query budgets fail the request
+    QUERY_CHECKS = 'raise'
+
 # Configuration dictionary
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
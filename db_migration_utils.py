@@ -17,7 +17,7 @@ def migrate_to_postgres():
     3. Import data into PostgreSQL
     """
     # Create a temp file for the data
-    temp_file = tempfile.mktemp(suffix='.json')
+    temp_file = tempfile.mktemp(suffix='.json.gz')
     
     # Export data using SQLite connection
     print("Exporting data from SQLite...")
@@ -43,15 +43,18 @@ def migrate_to_postgres():
     # Clean up the temp file
     os.unlink(temp_file)
 
-def backup_production_db():
+def backup_production_db(incremental=False):
     """
-    Create a backup of the production database
+    Create a backup of the production database.
+    Uses the same streaming, compressed writer as the admin backup page.
+    With incremental=True only changes since the latest backup are written
+    (suitable for an hourly cron job).
     """
     # Create app with production configuration
     app = create_app('production')
     with app.app_context():
         # Generate a timestamped filename
-        backup_path = export_data()
+        backup_path = export_data(incremental=incremental)
         print(f"Production database backed up to: {backup_path}")
         return backup_path
 
@@ -59,7 +62,7 @@ if __name__ == '__main__':
     import sys
     
     if len(sys.argv) < 2:
-        print("Usage: python db_migration_utils.py [migrate|backup]")
+        print("Usage: python db_migration_utils.py [migrate|backup|backup-incremental]")
         sys.exit(1)
     
     action = sys.argv[1]
@@ -68,7 +71,9 @@ if __name__ == '__main__':
         migrate_to_postgres()
     elif action == 'backup':
         backup_production_db()
+    elif action == 'backup-incremental':
+        backup_production_db(incremental=True)
     else:
         print(f"Unknown action: {action}")
-        print("Usage: python db_migration_utils.py [migrate|backup]")
+        print("Usage: python db_migration_utils.py [migrate|backup|backup-incremental]")
         sys.exit(1)
@@ -0,0 +1,55 @@
+"""add indexes for the hot filter/sort columns
+
+Revision ID: 3f2a9c1d7e54
+Revises: a9d4e7b2c618
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e54'
+down_revision = 'a9d4e7b2c618'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns)
+INDEXES = [
+    ('ix_atv_status', 'atv', ['status']),
+    ('ix_atv_parting_status_created_at', 'atv', ['parting_status', 'created_at']),
+    ('ix_atv_created_at', 'atv', ['created_at']),
+    ('ix_atv_purchase_date', 'atv', ['purchase_date']),
+    ('ix_part_status_sold_date', 'part', ['status', 'sold_date']),
+    ('ix_part_atv_id_status', 'part', ['atv_id', 'status']),
+    ('ix_part_tote', 'part', ['tote']),
+    ('ix_part_storage_id', 'part', ['storage_id']),
+    ('ix_part_created_at', 'part', ['created_at']),
+    ('ix_expense_date', 'expense', ['date']),
+    ('ix_expense_atv_id', 'expense', ['atv_id']),
+    ('ix_sale_type_date', 'sale', ['type', 'date']),
+    ('ix_sale_date', 'sale', ['date']),
+    ('ix_sale_atv_id', 'sale', ['atv_id']),
+    ('ix_image_part_id', 'image', ['part_id']),
+    ('ix_image_atv_id', 'image', ['atv_id']),
+]
+
+
+def _existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # Databases built by db.create_all() may already have some of these
+    for name, table, columns in INDEXES:
+        if name in _existing_indexes(table):
+            continue
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,50 @@
+"""add updated_at columns and the backup tombstone table for incremental backups
+
+Revision ID: 8b1e6f2c4a90
+Revises: 3f2a9c1d7e54
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e6f2c4a90'
+down_revision = '3f2a9c1d7e54'
+branch_labels = None
+depends_on = None
+
+# Tables that gain an updated_at column (atv and storage already have one)
+UPDATED_AT_TABLES = ['part', 'expense', 'sale', 'image']
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table in UPDATED_AT_TABLES:
+        # create_app's schema fix may already have added it
+        if 'updated_at' not in {c['name'] for c in inspector.get_columns(table)}:
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    if 'backup_tombstone' not in inspector.get_table_names():
+        op.create_table(
+            'backup_tombstone',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('table_name', sa.String(length=64), nullable=False),
+            sa.Column('row_id', sa.Integer(), nullable=False),
+            sa.Column('deleted_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_backup_tombstone_deleted_at', 'backup_tombstone', ['deleted_at'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'backup_tombstone' in inspector.get_table_names():
+        op.drop_index('ix_backup_tombstone_deleted_at', table_name='backup_tombstone')
+        op.drop_table('backup_tombstone')
+
+    for table in UPDATED_AT_TABLES:
+        if 'updated_at' in {c['name'] for c in inspector.get_columns(table)}:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column('updated_at')
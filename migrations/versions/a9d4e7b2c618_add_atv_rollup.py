@@ -0,0 +1,64 @@
+"""add atv_rollup, the per-ATV financial totals kept current on flush, and backfill it
+
+Revision ID: a9d4e7b2c618
+Revises: 
+Create Date: 2026-10-18 08:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4e7b2c618'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Same totals as app.models.refresh_atv_rollups(), for every ATV without a rollup row
+BACKFILL = """
+INSERT INTO atv_rollup (atv_id, expenses_total, sales_total, parts_value, parts_profit,
+                        sold_part_count, part_count, updated_at)
+SELECT atv.id,
+       COALESCE((SELECT SUM(expense.amount) FROM expense WHERE expense.atv_id = atv.id), 0),
+       COALESCE((SELECT SUM(sale.amount) FROM sale WHERE sale.atv_id = atv.id), 0),
+       COALESCE((SELECT SUM(CASE WHEN part.status = 'sold' THEN COALESCE(part.sold_price, 0)
+                                 ELSE COALESCE(part.list_price, 0) END)
+                 FROM part WHERE part.atv_id = atv.id), 0),
+       COALESCE((SELECT SUM(CASE WHEN part.status = 'sold' AND COALESCE(part.sold_price, 0) != 0
+                                 THEN part.sold_price - COALESCE(part.source_price, 0)
+                                      - COALESCE(part.shipping_cost, 0) - COALESCE(part.platform_fees, 0)
+                                 ELSE 0 END)
+                 FROM part WHERE part.atv_id = atv.id), 0),
+       (SELECT COUNT(*) FROM part WHERE part.atv_id = atv.id AND part.status = 'sold'),
+       (SELECT COUNT(*) FROM part WHERE part.atv_id = atv.id),
+       CURRENT_TIMESTAMP
+FROM atv
+WHERE atv.id NOT IN (SELECT atv_id FROM atv_rollup)
+"""
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # create_app may already have created (and backfilled) it
+    if 'atv_rollup' not in inspector.get_table_names():
+        op.create_table(
+            'atv_rollup',
+            sa.Column('atv_id', sa.Integer(), nullable=False),
+            sa.Column('expenses_total', sa.Float(), nullable=False),
+            sa.Column('sales_total', sa.Float(), nullable=False),
+            sa.Column('parts_value', sa.Float(), nullable=False),
+            sa.Column('parts_profit', sa.Float(), nullable=False),
+            sa.Column('sold_part_count', sa.Integer(), nullable=False),
+            sa.Column('part_count', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['atv_id'], ['atv.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('atv_id')
+        )
+    op.execute(BACKFILL)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'atv_rollup' in inspector.get_table_names():
+        op.drop_table('atv_rollup')
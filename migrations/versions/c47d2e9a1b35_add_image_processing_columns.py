@@ -0,0 +1,39 @@
+"""add processing_status and content_hash to image for background processing
+
+Revision ID: c47d2e9a1b35
+Revises: 8b1e6f2c4a90
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47d2e9a1b35'
+down_revision = '8b1e6f2c4a90'
+branch_labels = None
+depends_on = None
+
+IMAGE_COLUMNS = [
+    ('processing_status', sa.String(length=20)),
+    ('content_hash', sa.String(length=64)),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = {c['name'] for c in inspector.get_columns('image')}
+    for name, column_type in IMAGE_COLUMNS:
+        # create_app's schema fix may already have added it
+        if name not in existing:
+            op.add_column('image', sa.Column(name, column_type, nullable=True))
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = {c['name'] for c in inspector.get_columns('image')}
+    with op.batch_alter_table('image') as batch_op:
+        for name, _ in reversed(IMAGE_COLUMNS):
+            if name in existing:
+                batch_op.drop_column(name)
@@ -0,0 +1,31 @@
+"""index image.content_hash for image store reference counting
+
+Revision ID: e5a8f03c6d12
+Revises: c47d2e9a1b35
+Create Date: 2026-10-18 14:00:00.000000
+
+Files already on disk are moved into the store separately, by
+scripts/migrate_images_to_store.py.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a8f03c6d12'
+down_revision = 'c47d2e9a1b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_image_content_hash' not in {i['name'] for i in inspector.get_indexes('image')}:
+        op.create_index('ix_image_content_hash', 'image', ['content_hash'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_image_content_hash' in {i['name'] for i in inspector.get_indexes('image')}:
+        op.drop_index('ix_image_content_hash', table_name='image')
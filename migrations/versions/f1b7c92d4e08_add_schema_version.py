@@ -0,0 +1,35 @@
+"""add schema_version, the fingerprint create_app checks before repairing the schema
+
+Revision ID: f1b7c92d4e08
+Revises: e5a8f03c6d12
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7c92d4e08'
+down_revision = 'e5a8f03c6d12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # create_app may already have created it
+    if 'schema_version' not in inspector.get_table_names():
+        op.create_table(
+            'schema_version',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('fingerprint', sa.String(length=64), nullable=False),
+            sa.Column('applied_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'schema_version' in inspector.get_table_names():
+        op.drop_table('schema_version')
@@ -4,6 +4,9 @@
 # Install dependencies
 pip install -r requirements.txt
 
+# Build hashed, compressed static assets
+python scripts/build_static.py
+
 # Initialize database if running in production
 if [ "$FLASK_CONFIG" = "production" ]; then
   echo "Running database migrations and initialization..."
@@ -0,0 +1,23 @@
+"""
+Script to build the static assets served in production.
+
+Writes a content-hashed copy of every file in app/static (uploads excluded),
+gzip and brotli variants (brotli when the Brotli package is installed) and
+the manifest that templates use to link the hashed names. Run it on deploy,
+after the code is in place; it doesn't need the database.
+
+Usage: python scripts/build_static.py
+"""
+import os
+import sys
+
+# Make sure we can import from the app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config, basedir
+from app.utils.assets import build_static
+
+if __name__ == '__main__':
+    source = os.path.join(basedir, 'app', 'static')
+    manifest = build_static(source, Config.STATIC_BUILD_FOLDER)
+    print(f"Built {len(manifest)} static assets into {Config.STATIC_BUILD_FOLDER}")
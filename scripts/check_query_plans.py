@@ -0,0 +1,92 @@
+"""
+Script to confirm the report and list queries use the hot-path indexes.
+
+Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for each query shape and checks
+that the expected index shows up in the plan. Exits non-zero if any don't.
+
+Usage: python scripts/check_query_plans.py
+"""
+import os
+import sys
+from datetime import datetime
+
+# Make sure we can import from the app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func
+from app import db, create_app
+from app.models import ATV, Part, Expense, Sale, Image
+
+START = datetime(2024, 1, 1)
+END = datetime(2024, 12, 31, 23, 59, 59)
+
+# (description, statement, index the plan should use)
+CHECKS = [
+    ("reports.financial: monthly part sales",
+     db.select(func.sum(Part.sold_price))
+     .where(Part.status == 'sold', Part.sold_date.between(START, END)),
+     'ix_part_status_sold_date'),
+    ("reports.financial: monthly expenses",
+     db.select(func.sum(Expense.amount)).where(Expense.date.between(START, END)),
+     'ix_expense_date'),
+    ("atv.reports: full ATV sales",
+     db.select(func.count(Sale.id), func.sum(Sale.amount))
+     .where(Sale.type == 'full_atv', Sale.date.between(START, END)),
+     'ix_sale_type_date'),
+    ("atv.reports: sales transactions",
+     db.select(Sale.id).where(Sale.date.between(START, END)),
+     'ix_sale_date'),
+    ("atv.reports: ATV purchases",
+     db.select(func.sum(ATV.purchase_price))
+     .where(ATV.purchase_date.between(START.date(), END.date()), ATV.status != 'deleted'),
+     'ix_atv_purchase_date'),
+    ("parts_list: parts for one ATV by status",
+     db.select(Part.id).where(Part.atv_id == 1, Part.status == 'listed'),
+     'ix_part_atv_id_status'),
+    ("parts_list: tote filter",
+     db.select(Part.id).where(Part.tote == 'TOTE_A1'),
+     'ix_part_tote'),
+    ("parts_list: storage filter",
+     db.select(Part.id).where(Part.storage_id == 1),
+     'ix_part_storage_id'),
+    ("part images",
+     db.select(Image.id).where(Image.part_id == 1),
+     'ix_image_part_id'),
+]
+
+def explain(connection, statement):
+    """Return the query plan for a statement as a single string"""
+    compiled = statement.compile(dialect=connection.dialect)
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    if connection.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    rows = connection.exec_driver_sql(prefix + compiled.string, params).fetchall()
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+def check_query_plans():
+    failures = 0
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Small tables make a seq scan cheapest; we only care that the index is usable
+            connection.exec_driver_sql('SET enable_seqscan = off')
+        for description, statement, index_name in CHECKS:
+            plan = explain(connection, statement)
+            ok = index_name in plan
+            failures += 0 if ok else 1
+            print(f"[{'OK' if ok else 'MISSING'}] {description} -> {index_name}")
+            if not ok:
+                print('    ' + plan.replace('\n', '\n    '))
+    return failures
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        failures = check_query_plans()
+    if failures:
+        print(f"\n{failures} queries are not using their index. Run 'flask db upgrade'.")
+        sys.exit(1)
+    print("\nAll checked queries use their indexes.")
@@ -0,0 +1,76 @@
+"""
+Script to generate the thumb/medium/full variants for images uploaded
+before variants were created on upload.
+
+Images that already have all their variants are skipped, so it is safe to
+re-run. Pages fall back to the original file until an image has variants.
+Each image's processing_status is brought up to date as well, so rows left
+pending or failed by a lost background job are marked ready. Variants made
+with older IMAGE_SIZES or VARIANT_QUALITY settings are removed once the
+current ones exist.
+
+Usage: python scripts/generate_image_variants.py
+"""
+import os
+import sys
+
+# Make sure we can import from the app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import db, create_app
+from app.models import Image
+from app.utils.images import IMAGE_SIZES, image_directory, variant_filename, variant_files, generate_variants
+
+BATCH_SIZE = 500
+
+def set_status(image_ids, status):
+    for start in range(0, len(image_ids), BATCH_SIZE):
+        (Image.query.filter(Image.id.in_(image_ids[start:start + BATCH_SIZE]))
+         .update({Image.processing_status: status}, synchronize_session=False))
+
+def remove_outdated_variants(directory, filename):
+    current = {variant_filename(filename, size) for size in IMAGE_SIZES}
+    removed = 0
+    for name in variant_files(directory, filename):
+        if name not in current:
+            try:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+def generate_missing_variants():
+    generated = skipped = missing = outdated = 0
+    # Statuses are written after the scan so the yield_per cursor stays open
+    ready_ids, failed_ids = [], []
+    for image in Image.query.order_by(Image.id).yield_per(BATCH_SIZE):
+        directory = image_directory(image)
+        path = os.path.join(directory, image.filename)
+        if not os.path.exists(path):
+            missing += 1
+            continue
+        if all(os.path.exists(os.path.join(directory, variant_filename(image.filename, size)))
+               for size in IMAGE_SIZES):
+            skipped += 1
+            if image.processing_status != 'ready':
+                ready_ids.append(image.id)
+            outdated += remove_outdated_variants(directory, image.filename)
+            continue
+        if generate_variants(path):
+            generated += 1
+            ready_ids.append(image.id)
+            outdated += remove_outdated_variants(directory, image.filename)
+        else:
+            failed_ids.append(image.id)
+    set_status(ready_ids, 'ready')
+    set_status(failed_ids, 'failed')
+    db.session.commit()
+    print(f"Generated variants for {generated} images "
+          f"({skipped} already done, {missing} original files missing, "
+          f"{outdated} outdated variant files removed)")
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        generate_missing_variants()
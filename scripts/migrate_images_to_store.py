@@ -0,0 +1,93 @@
+"""
+Script to move images uploaded before the content-addressed store into it.
+
+Each original is hashed and linked (or copied) into store/<ab>/<cd>/, along
+with any variants it already has that match the current IMAGE_SIZES and
+VARIANT_QUALITY; identical photos end up as one file. The Image rows are
+updated in batches and the old files are only removed once the batch has
+committed, so an interrupted run leaves every row pointing at a file that
+exists. Safe to re-run: images already in the store are skipped.
+
+Usage: python scripts/migrate_images_to_store.py
+"""
+import os
+import shutil
+import sys
+
+# Make sure we can import from the app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import db, create_app
+from app.models import Image
+from app.utils.images import (IMAGE_SIZES, file_sha256, is_stored, legacy_image_directory,
+                              store_directory, store_filename, variant_filename, variant_files)
+
+BATCH_SIZE = 200
+
+def place_file(source, target):
+    """Put a copy of source at target (a hard link when possible). False if target existed."""
+    if os.path.exists(target):
+        return False
+    try:
+        os.link(source, target)
+    except OSError:
+        # Different filesystem, or links not supported
+        shutil.copy2(source, target)
+    return True
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def migrate_images():
+    moved = deduplicated = missing = 0
+    bytes_freed = 0
+    old_paths = []
+    for image in Image.query.order_by(Image.id).all():
+        if is_stored(image):
+            continue
+        old_directory = legacy_image_directory(image)
+        old_path = os.path.join(old_directory, image.filename)
+        if not os.path.exists(old_path):
+            missing += 1
+            continue
+
+        content_hash = file_sha256(old_path)
+        extension = image.filename.rsplit('.', 1)[1].lower() if '.' in image.filename else ''
+        filename = store_filename(content_hash, extension)
+        directory = store_directory(content_hash)
+        os.makedirs(directory, exist_ok=True)
+
+        if place_file(old_path, os.path.join(directory, filename)):
+            moved += 1
+        else:
+            deduplicated += 1
+            bytes_freed += os.path.getsize(old_path)
+        old_paths.append(old_path)
+        for size in IMAGE_SIZES:
+            old_variant = os.path.join(old_directory, variant_filename(image.filename, size))
+            if os.path.exists(old_variant):
+                place_file(old_variant, os.path.join(directory, variant_filename(filename, size)))
+        # Variants from older settings aren't carried over; generate_image_variants.py remakes them
+        old_paths.extend(os.path.join(old_directory, name) for name in variant_files(old_directory, image.filename))
+
+        image.content_hash = content_hash
+        image.filename = filename
+
+        if len(old_paths) >= BATCH_SIZE:
+            db.session.commit()
+            remove_files(old_paths)
+            old_paths = []
+
+    db.session.commit()
+    remove_files(old_paths)
+    print(f"Moved {moved} images into the store and deduplicated {deduplicated} "
+          f"({bytes_freed / 1024 / 1024:.1f} MB freed, {missing} original files missing)")
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        migrate_images()
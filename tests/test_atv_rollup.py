@@ -0,0 +1,122 @@
+"""The atv_rollup row follows every part, expense and sale change made through the ORM.
+
+Each test commits, then changes objects that commit expired, so the flush
+hooks have to load atv_id rather than read it from the object's state.
+"""
+import pytest
+
+from app import db
+from app.models import ATV, ATVRollup, Expense, Part, Sale
+
+def rollup(atv_id):
+    db.session.expire_all()
+    return db.session.get(ATVRollup, atv_id)
+
+@pytest.fixture
+def atvs(app):
+    first = ATV(make='Honda', model='TRX250', year=2004)
+    second = ATV(make='Yamaha', model='Kodiak', year=2006)
+    db.session.add_all([first, second])
+    db.session.commit()
+    return first.id, second.id
+
+def test_new_atv_gets_an_empty_rollup(atvs):
+    row = rollup(atvs[0])
+    assert (row.expenses_total, row.sales_total, row.parts_value, row.part_count) == (0, 0, 0, 0)
+
+def test_expense_add_edit_delete(atvs):
+    atv_id = atvs[0]
+    expense = Expense(atv_id=atv_id, amount=40, category='repairs')
+    db.session.add(expense)
+    db.session.commit()
+    assert rollup(atv_id).expenses_total == 40
+
+    expense.amount = 55
+    db.session.commit()
+    assert rollup(atv_id).expenses_total == 55
+
+    db.session.delete(expense)
+    db.session.commit()
+    assert rollup(atv_id).expenses_total == 0
+
+def test_sale_add_edit_delete(atvs):
+    atv_id = atvs[0]
+    sale = Sale(atv_id=atv_id, amount=300, type='part')
+    db.session.add(sale)
+    db.session.commit()
+    assert rollup(atv_id).sales_total == 300
+
+    sale.amount = 250
+    db.session.commit()
+    assert rollup(atv_id).sales_total == 250
+
+    db.session.delete(sale)
+    db.session.commit()
+    assert rollup(atv_id).sales_total == 0
+
+def test_part_add_sell_delete(atvs):
+    atv_id = atvs[0]
+    part = Part(atv_id=atv_id, name='Carburetor', status='in_stock', list_price=80, source_price=10)
+    db.session.add(part)
+    db.session.commit()
+    row = rollup(atv_id)
+    assert (row.part_count, row.sold_part_count, row.parts_value, row.parts_profit) == (1, 0, 80, 0)
+
+    part.status = 'sold'
+    part.sold_price = 100
+    part.shipping_cost = 12
+    part.platform_fees = 8
+    db.session.commit()
+    row = rollup(atv_id)
+    assert (row.part_count, row.sold_part_count, row.parts_value, row.parts_profit) == (1, 1, 100, 70)
+
+    db.session.delete(part)
+    db.session.commit()
+    row = rollup(atv_id)
+    assert (row.part_count, row.sold_part_count, row.parts_value, row.parts_profit) == (0, 0, 0, 0)
+
+def test_part_moved_between_atvs(atvs):
+    first, second = atvs
+    part = Part(atv_id=first, name='Axle', status='listed', list_price=60)
+    db.session.add(part)
+    db.session.commit()
+
+    part.atv_id = second
+    db.session.commit()
+
+    assert (rollup(first).part_count, rollup(first).parts_value) == (0, 0)
+    assert (rollup(second).part_count, rollup(second).parts_value) == (1, 60)
+
+def test_untracked_change_leaves_rollup_alone(atvs):
+    atv_id = atvs[0]
+    part = Part(atv_id=atv_id, name='Seat', status='in_stock', list_price=30)
+    db.session.add(part)
+    db.session.commit()
+    updated_at = rollup(atv_id).updated_at
+
+    part.description = 'Torn cover'
+    db.session.commit()
+
+    assert rollup(atv_id).updated_at == updated_at
+
+def test_deleting_atv_drops_its_rollup(atvs):
+    atv_id = atvs[0]
+    db.session.add(Part(atv_id=atv_id, name='Fender', status='in_stock', list_price=20))
+    db.session.commit()
+
+    db.session.delete(db.session.get(ATV, atv_id))
+    db.session.commit()
+
+    assert rollup(atv_id) is None
+
+def test_part_moved_by_relationship(atvs):
+    first, second = atvs
+    part = Part(atv_id=first, name='Hub', status='listed', list_price=45)
+    db.session.add(part)
+    db.session.commit()
+
+    part.atv = db.session.get(ATV, second)
+    db.session.commit()
+
+    assert (rollup(first).part_count, rollup(first).parts_value) == (0, 0)
+    assert (rollup(second).part_count, rollup(second).parts_value) == (1, 45)
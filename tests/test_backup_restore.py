@@ -0,0 +1,99 @@
+"""Backups restore to the same rows, through import_data and its bulk writer."""
+import json
+from datetime import date, datetime
+
+import pytest
+
+from app import db
+from app.models import ATV, ATVRollup, Expense, Part, Storage
+from app.utils import data_management
+from app.utils.data_management import export_data, import_data
+
+@pytest.fixture
+def backups(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_management, 'backup_dir', lambda: str(tmp_path))
+    return tmp_path
+
+def seed():
+    shelf = Storage(name='Shelf A')
+    atv = ATV(make='Honda', model='TRX250', year=2004, vin='1HFTE', purchase_price=900,
+              purchase_date=date(2025, 3, 1))
+    db.session.add_all([shelf, atv])
+    db.session.add(Part(atv=atv, name='Carburetor', status='sold', list_price=80,
+                        sold_price=95, source_price=10, storage=shelf,
+                        sold_date=datetime(2025, 4, 2, 10, 30)))
+    db.session.add(Part(atv=atv, name='Seat', status='in_stock', list_price=40))
+    db.session.add(Expense(atv=atv, amount=35, category='repairs', date=datetime(2025, 3, 5)))
+    db.session.commit()
+    return atv.id
+
+def snapshot_rows():
+    return {
+        model.__tablename__: sorted(
+            tuple(row) for row in db.session.execute(db.select(*model.__table__.columns))
+        )
+        for model in (Storage, ATV, Part, Expense)
+    }
+
+def test_full_backup_round_trip(backups):
+    atv_id = seed()
+    before = snapshot_rows()
+    path = export_data(str(backups / 'full.json.gz'))
+
+    stats = import_data(path, clear_existing=True)
+
+    assert snapshot_rows() == before
+    assert stats['parts'][0] == 2
+    rollup = db.session.get(ATVRollup, atv_id)
+    assert (rollup.part_count, rollup.expenses_total) == (2, 35)
+
+def test_restore_keeps_columns_missing_from_the_first_row(backups):
+    # A hand-edited or older backup: the first ATV row carries fewer keys than the second
+    data = {
+        'atvs': [
+            {'id': 1, 'make': 'Honda', 'model': 'TRX90', 'year': 2001},
+            {'id': 2, 'make': 'Yamaha', 'model': 'Kodiak', 'year': 2006, 'vin': 'JY4AM',
+             'purchase_price': 1200, 'purchase_date': '2025-02-10', 'repair_hours': 3,
+             'parting_status': 'parting_out'},
+        ],
+        'parts': [
+            {'id': 1, 'atv_id': 1, 'name': 'Tire'},
+            {'id': 2, 'atv_id': 2, 'name': 'Winch', 'status': 'sold', 'sold_price': 150,
+             'sold_date': '2025-03-01 09:15:00'},
+        ],
+    }
+    path = backups / 'legacy.json'
+    path.write_text(json.dumps(data))
+
+    import_data(str(path))
+
+    first, second = db.session.get(ATV, 1), db.session.get(ATV, 2)
+    assert (second.vin, second.purchase_price, second.repair_hours) == ('JY4AM', 1200, 3)
+    assert second.purchase_date == date(2025, 2, 10)
+    assert second.parting_status == 'parting_out'
+    # Keys a row leaves out fall back to the restore defaults or the column default
+    assert (first.vin, first.parting_status, first.repair_hours, first.status) == (None, 'whole', 0, 'active')
+    assert db.session.get(Part, 2).sold_date == datetime(2025, 3, 1, 9, 15)
+    assert db.session.get(Part, 1).status == 'in_stock'
+
+def test_delta_chain_replays_deletes(backups):
+    atv_id = seed()
+    full = export_data(incremental=True)
+
+    seat = Part.query.filter_by(name='Seat').one()
+    db.session.delete(seat)
+    db.session.get(ATV, atv_id).vin = 'CHANGED'
+    db.session.add(Expense(atv_id=atv_id, amount=15, category='parts'))
+    db.session.commit()
+    delta = export_data(incremental=True)
+    after = snapshot_rows()
+
+    assert data_management.read_backup_manifest(delta)['kind'] == 'delta'
+    assert data_management.backup_chain(delta) == [full, delta]
+
+    import_data(delta, clear_existing=True)
+
+    assert snapshot_rows() == after
+    assert [part.name for part in Part.query] == ['Carburetor']
+    rollup = db.session.get(ATVRollup, atv_id)
+    assert (rollup.part_count, rollup.expenses_total) == (1, 50)
@@ -0,0 +1,29 @@
+"""Streamed responses are compressed chunk by chunk and still release their body."""
+import gzip
+
+from flask import Response
+
+class ClosingBody:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+def test_streamed_response_is_compressed_and_closed(app):
+    body = ClosingBody([b'make,model\n'] + [b'Honda,TRX250\n'] * 200)
+
+    @app.route('/stream')
+    def stream():
+        return Response(body, mimetype='text/csv')
+
+    response = app.test_client().get('/stream', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == b''.join(body.chunks)
+    response.close()
+    assert body.closed
@@ -0,0 +1,97 @@
+"""The content-addressed store keeps one copy per photo and drops it with the last reference."""
+import io
+import os
+import time
+
+import pytest
+from PIL import Image as PILImage
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.models import ATV, Image, Part
+from app.utils.image_worker import add_uploaded_image
+from app.utils.images import STORE_RELEASE_GRACE, image_directory, variant_files
+
+@pytest.fixture
+def part(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    atv = ATV(make='Honda', model='TRX250', year=2004)
+    part = Part(atv=atv, name='Carburetor')
+    db.session.add(part)
+    db.session.commit()
+    return part
+
+def photo():
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (640, 480), (200, 40, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def upload(part, data):
+    image = add_uploaded_image(FileStorage(io.BytesIO(data), filename='photo.jpg'), 'jpg',
+                               part_id=part.id, image_type='general')
+    db.session.commit()
+    return image
+
+def store_files(image):
+    directory = image_directory(image)
+    return sorted([image.filename] + variant_files(directory, image.filename))
+
+def age(image, seconds=STORE_RELEASE_GRACE + 60):
+    # Push the files out of the grace period a fresh upload gets
+    directory = image_directory(image)
+    past = time.time() - seconds
+    for name in os.listdir(directory):
+        os.utime(os.path.join(directory, name), (past, past))
+
+def test_same_upload_is_stored_once(part):
+    data = photo()
+    first = upload(part, data)
+    second = upload(part, data)
+
+    assert first.content_hash == second.content_hash
+    assert first.filename == second.filename
+    assert second.processing_status == 'ready'
+    directory = image_directory(first)
+    assert sorted(os.listdir(directory)) == store_files(first)
+    assert len(os.listdir(directory)) == 4  # the original plus thumb, medium and full
+
+def test_files_stay_until_the_last_reference_goes(part):
+    data = photo()
+    first = upload(part, data)
+    second = upload(part, data)
+    directory = image_directory(first)
+    age(first)
+
+    db.session.delete(first)
+    db.session.commit()
+    assert os.path.exists(os.path.join(directory, second.filename))
+
+    db.session.delete(second)
+    db.session.commit()
+    assert os.listdir(directory) == []
+
+def test_gc_removes_files_kept_through_the_grace_period(app, part):
+    image = upload(part, photo())
+    directory = image_directory(image)
+
+    # Deleted straight after upload: the release keeps the files in case an upload reuses them
+    db.session.delete(image)
+    db.session.commit()
+    assert os.listdir(directory)
+
+    runner = app.test_cli_runner()
+    assert 'Removed the files of 0' in runner.invoke(args=['amf', 'gc-images']).output
+    assert os.listdir(directory)
+
+    age(image)
+    assert 'Removed the files of 1' in runner.invoke(args=['amf', 'gc-images']).output
+    assert os.listdir(directory) == []
+
+def test_gc_keeps_referenced_files(app, part):
+    image = upload(part, photo())
+    age(image)
+
+    app.test_cli_runner().invoke(args=['amf', 'gc-images'])
+
+    assert sorted(os.listdir(image_directory(image))) == store_files(image)
+    assert Image.query.count() == 1
@@ -0,0 +1,74 @@
+"""Keyset paging visits every ATV exactly once, in order, in both directions.
+
+Several ATVs share each sort value, so the primary-key tiebreaker decides
+where a page ends.
+"""
+import pytest
+from sqlalchemy.orm import contains_eager
+
+from app import db
+from app.atv.routes import atv_sort_order
+from app.models import ATV, Expense, Sale
+from app.utils.pagination import keyset_paginate
+
+ATV_COUNT = 11
+PER_PAGE = 3
+
+def atv_query():
+    return ATV.query.outerjoin(ATV.rollup).options(contains_eager(ATV.rollup))
+
+def walk_forward(sort_by):
+    order = atv_sort_order(sort_by)
+    pages, cursor = [], None
+    while True:
+        page = keyset_paginate(atv_query(), order, sort_by, after=cursor, per_page=PER_PAGE)
+        pages.append(page)
+        if not page.has_next:
+            return pages
+        cursor = page.next_cursor
+
+@pytest.fixture
+def atvs(app):
+    for i in range(ATV_COUNT):
+        # Three years and three profit levels, so most sort values are shared
+        atv = ATV(make='Honda', model=f'TRX{i % 2}', year=2000 + i % 3,
+                  purchase_price=500, total_hours=2 + i % 2)
+        db.session.add(atv)
+        db.session.add(Sale(atv=atv, amount=500 + 100 * (i % 3), type='whole'))
+        db.session.add(Expense(atv=atv, amount=50, category='repairs'))
+    db.session.commit()
+
+@pytest.mark.parametrize('sort_by', ['year_asc', 'year_desc', 'make_asc', 'profit', 'profit_rate'])
+def test_pages_follow_the_full_order(atvs, sort_by):
+    order = atv_sort_order(sort_by)
+    expected = [atv.id for atv in atv_query().order_by(
+        *[expr.desc() if desc else expr.asc() for expr, desc in order])]
+
+    pages = walk_forward(sort_by)
+
+    assert [atv.id for page in pages for atv in page.items] == expected
+    assert all(len(page.items) == PER_PAGE for page in pages[:-1])
+    assert not pages[0].has_prev
+
+def test_previous_links_retrace_the_pages(atvs):
+    order = atv_sort_order('profit')
+    pages = walk_forward('profit')
+
+    page = pages[-1]
+    for earlier in reversed(pages[:-1]):
+        page = keyset_paginate(atv_query(), order, 'profit', before=page.prev_cursor,
+                               per_page=PER_PAGE)
+        assert [atv.id for atv in page.items] == [atv.id for atv in earlier.items]
+        assert page.has_next
+    assert not page.has_prev
+
+def test_profit_sort_is_highest_first(atvs):
+    profits = [atv.profit_loss() for page in walk_forward('profit') for atv in page.items]
+    assert profits == sorted(profits, reverse=True)
+    assert profits[0] > profits[-1]
+
+def test_cursor_from_another_sort_starts_over(atvs):
+    first = walk_forward('year_asc')[0]
+    page = keyset_paginate(atv_query(), atv_sort_order('profit'), 'profit',
+                           after=first.next_cursor, per_page=PER_PAGE)
+    assert not page.has_prev
@@ -0,0 +1,90 @@
+"""Every page in query_budgets.json stays within its budget, with no N+1 queries.
+
+The app runs with the 'testing' config (QUERY_CHECKS = 'raise'), so a request
+over its budget or repeating one statement shape too often raises instead of
+rendering. The seeded data gives each ATV expenses, a sale, parts in every
+status and images, so per-row lookups have rows to multiply over.
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import ATV, Expense, Image, Part, Sale, Storage
+from app.utils.perf import query_budgets
+
+ATV_COUNT = 6
+PARTS_PER_ATV = 8
+PART_STATUSES = ['in_stock', 'listed', 'sold', 'reserved']
+
+# A page for every endpoint with a budget; {atv_id} is the first seeded ATV
+PAGES = {
+    'main.index': '/',
+    'atv.index': '/atv/',
+    'atv.view_atv': '/atv/{atv_id}',
+    'atv.atv_parts': '/atv/{atv_id}/parts',
+    'atv.atv_images': '/atv/{atv_id}/images',
+    'atv.parts_list': '/atv/parts',
+    'atv.reports': '/atv/reports?filter_type=year&year=2025',
+    'reports.index': '/reports',
+    'reports.financial': '/reports/financial',
+    'reports.inventory': '/reports/inventory',
+    'admin.index': '/admin',
+}
+
+def stored_image(seed, **attributes):
+    content_hash = hashlib.sha256(seed.encode()).hexdigest()
+    return Image(filename=f"{content_hash}.jpg", content_hash=content_hash,
+                 processing_status='ready', image_type='general', **attributes)
+
+def seed_inventory():
+    start = datetime(2025, 1, 1)
+    shelf = Storage(name='Shelf A')
+    db.session.add(shelf)
+    atvs = []
+    for i in range(ATV_COUNT):
+        atv = ATV(make='Honda', model=f'TRX{i}', year=2010 + i, purchase_price=800 + i * 50,
+                  parting_status='parting_out', purchase_date=(start + timedelta(days=i)).date(),
+                  repair_hours=2)
+        db.session.add(atv)
+        for j in range(3):
+            db.session.add(Expense(atv=atv, amount=20 + j, category='repairs',
+                                   date=start + timedelta(days=i * 7 + j)))
+        sale = Sale(atv=atv, amount=300, type='part', platform='ebay', fees=10, shipping_cost=15,
+                    date=start + timedelta(days=i * 7 + 3))
+        sale.calculate_net()
+        db.session.add(sale)
+        db.session.add(stored_image(f'atv-{i}', atv=atv))
+        for j in range(PARTS_PER_ATV):
+            status = PART_STATUSES[j % len(PART_STATUSES)]
+            part = Part(atv=atv, name=f'Part {i}-{j}', status=status, list_price=40 + j,
+                        source_price=5, tote='TOTE_A' if j % 2 else None,
+                        storage=shelf if j % 3 else None,
+                        created_at=start + timedelta(hours=i * 24 + j))
+            if status == 'sold':
+                part.sold_price = 60 + j
+                part.shipping_cost = 8
+                part.platform_fees = 6
+                part.sold_date = start + timedelta(days=i * 7 + j)
+            db.session.add(part)
+            db.session.add(stored_image(f'part-{i}-{j}', part=part))
+        atvs.append(atv)
+    db.session.commit()
+    return atvs[0].id
+
+def test_every_budgeted_endpoint_has_a_page(app):
+    assert set(query_budgets(app.config['QUERY_BUDGET_FILE'])) == set(PAGES)
+
+@pytest.mark.parametrize('endpoint', sorted(PAGES))
+def test_page_within_query_budget(app, endpoint):
+    atv_id = seed_inventory()
+    db.session.remove()
+    client = app.test_client()
+
+    url = PAGES[endpoint].format(atv_id=atv_id)
+    assert app.url_map.bind('localhost').match(url.split('?')[0])[0] == endpoint
+
+    response = client.get(url)
+
+    assert response.status_code == 200
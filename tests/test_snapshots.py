@@ -0,0 +1,51 @@
+"""SQLite snapshots copy the live database and restore it in place."""
+import pytest
+
+from app import create_app, db
+from app.models import ATV
+from app.utils import data_management
+from app.utils.data_management import create_snapshot, restore_snapshot
+from config import TestingConfig
+
+@pytest.fixture
+def file_app(tmp_path, monkeypatch):
+    # Snapshots need a file-backed database rather than the in-memory default
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'amf.db'}")
+    monkeypatch.setattr(data_management, 'backup_dir', lambda: str(tmp_path / 'backups'))
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_snapshot_restores_earlier_state(file_app, tmp_path):
+    db.session.add(ATV(make='Honda', model='TRX250', year=2004))
+    db.session.commit()
+    # Characters that would break a naive file: URI
+    target = tmp_path / 'snap 100% #1?' / 'before.sqlite3'
+    target.parent.mkdir()
+    snapshot = create_snapshot(str(target))
+
+    db.session.add(ATV(make='Yamaha', model='Kodiak', year=2006))
+    ATV.query.filter_by(make='Honda').one().vin = 'CHANGED'
+    db.session.commit()
+
+    assert restore_snapshot(snapshot) == snapshot
+
+    atvs = ATV.query.all()
+    assert [(atv.make, atv.vin) for atv in atvs] == [('Honda', None)]
+
+def test_default_snapshot_path_is_in_backups(file_app):
+    path = create_snapshot()
+    assert data_management.is_snapshot_file(path)
+    assert path.startswith(data_management.backup_dir())
+
+def test_restore_rejects_other_files(file_app, tmp_path):
+    bogus = tmp_path / 'bogus.sqlite3'
+    bogus.write_bytes(b'not a database')
+    with pytest.raises(ValueError):
+        restore_snapshot(str(bogus))
+
+def test_snapshots_need_sqlite_file(app):
+    with pytest.raises(ValueError):
+        create_snapshot()